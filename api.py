@@ -1,9 +1,20 @@
-from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from authorization import verify_api_key
 from pydantic import BaseModel
 from vera_core import VeraEngine
-from speech_to_text_whisper import transcribe_webm
+from session_manager import SessionManager
+from metrics import metrics
+from transcription_service import transcription_service, TranscriptionQueueFull
+from speech_service import speech_service, API_TTS
+from embeddings import EMBEDDING_MODEL
+from components import LazyComponent, prewarm, readiness, PREWARM
+import llm
+import json
+import os
+import re
 import uuid
 from typing import Optional
 
@@ -16,12 +27,13 @@ app.add_middleware(
     allow_headers=["*"],          # Allow all headers
 )
 
-# In-memory session store
-sessions: dict[str, VeraEngine] = {}
+# Bounded in-memory session store (LRU/TTL, per-session locking, spill to Postgres)
+session_manager = SessionManager(VeraEngine)
 
 class ChatRequest(BaseModel):
     session_id: str | None = None
     message: str
+    stream: bool = False  # Stream tokens as server-sent events
 
 class ChatResponse(BaseModel):
     session_id: str
@@ -41,32 +53,125 @@ class AudioRequest:
     def __init__(
         self,
         file: UploadFile = File(...),
-        session_id: str | None = Form(None)
+        session_id: str | None = Form(None),
+        stream: bool = Form(False)
     ):
         self.file = file
         self.session_id = session_id
+        self.stream = stream
 
 class AudioResponse(BaseModel):
     session_id: str
     transcript: str
     response: str
-    response_audio_url: Optional[str] = None # TTS URL placeholder
+    response_audio_url: Optional[str] = None # Spoken response, served by GET /audio/{audio_id}
+
+# llama3 and the embedding model, loaded in Ollama; keep_alive then keeps them loaded
+ollama_models = LazyComponent("llm", lambda: llm.warm_up(embedding_model=EMBEDDING_MODEL))
+
+@app.on_event("startup")
+async def prewarm_components():
+    # Everything else (Whisper, XTTS, the Twitch index) loads on first use unless listed in VERA_PREWARM
+    prewarm(["llm"] + PREWARM)
+    # Expire idle sessions even when no requests arrive
+    session_manager.start_sweeper()
+
+async def transcribe_upload(audio_bytes: bytes) -> str:
+    try:
+        return await transcription_service.transcribe(audio_bytes)
+    except TranscriptionQueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Transcription queue is full, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+
+def speak_response(response: str) -> str | None:
+    """Start server-side TTS for a response and return the URL its audio will be served from."""
+    if not API_TTS or not response.strip():
+        return None
+    return f"/audio/{speech_service.request(response)}"
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+async def range_response(path: str, range_header: str | None) -> Response:
+    """Serve a file whole, or the single byte range asked for by a Range header (206)."""
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes"}
+
+    match = RANGE_PATTERN.match(range_header.strip()) if range_header else None
+    if not match or match.groups() == ("", ""):
+        return FileResponse(path, media_type="audio/wav", headers=headers)
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1  # suffix range: the last N bytes
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    # Only the requested slice is read, off the event loop
+    data = await run_in_threadpool(read_range, path, start, end + 1 - start)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(data, status_code=206, media_type="audio/wav", headers=headers)
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return prefix + f"data: {json.dumps(data)}\n\n"
+
+async def stream_events(session_id: str, prompt: str, speak: bool = False, **metadata):
+    """
+    Server-sent events for one turn:
+    a `session` event with metadata, one `data` event per token, then `done` with the full response
+    (and, with speak, its `response_audio_url`). The session lock is held until the stream ends.
+    """
+    async with session_manager.session(session_id) as engine:
+        yield sse_event({"session_id": session_id, **metadata}, event="session")
+
+        response = ""
+        async for token in engine.astream_response(prompt):
+            response += token
+            yield sse_event({"token": token})
+
+        done = {"response": response}
+        if speak:
+            done["response_audio_url"] = speak_response(response)
+        yield sse_event(done, event="done")
 
 @app.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_api_key)])
-def chat(req: ChatRequest) -> ChatResponse:
+async def chat(req: ChatRequest) -> ChatResponse:
 
     session_id = req.session_id or str(uuid.uuid4())
-    if session_id not in sessions:
-        sessions[session_id] = VeraEngine()
+    if req.stream:
+        return StreamingResponse(
+            stream_events(session_id, req.message),
+            media_type="text/event-stream",
+        )
 
-    engine = sessions[session_id]
-    response = engine.generate_response(req.message)
+    async with session_manager.session(session_id) as engine:
+        response = await engine.agenerate_response(req.message)
 
     return {
         "session_id": session_id,
         "response": response
     }
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until the llm and VERA_PREWARM components are loaded."""
+    is_ready, status = readiness(["llm"] + PREWARM)
+    return JSONResponse({"ready": is_ready, "components": status}, status_code=200 if is_ready else 503)
+
+@app.get("/metrics", dependencies=[Depends(verify_api_key)])
+def get_metrics():
+    return metrics.snapshot()
+
 @app.post("/transcribe", response_model=TranscribeResponse, dependencies=[Depends(verify_api_key)])
 async def transcribe(req: TranscribeRequest = Depends()) -> TranscribeResponse:
 
@@ -77,7 +182,7 @@ async def transcribe(req: TranscribeRequest = Depends()) -> TranscribeResponse:
         )
     
     audio_bytes = await req.file.read()
-    transcript = transcribe_webm(audio_bytes)
+    transcript = await transcribe_upload(audio_bytes)
 
     return TranscribeResponse(
         transcript=transcript
@@ -87,8 +192,6 @@ async def transcribe(req: TranscribeRequest = Depends()) -> TranscribeResponse:
 async def audio_chat(req: AudioRequest = Depends()) -> AudioResponse:
 
     session_id = req.session_id or str(uuid.uuid4())
-    if session_id not in sessions:
-        sessions[session_id] = VeraEngine()
 
     if not req.file.content_type.startswith("audio/"):
         raise HTTPException(
@@ -97,14 +200,37 @@ async def audio_chat(req: AudioRequest = Depends()) -> AudioResponse:
         )
     
     audio_bytes = await req.file.read()
-    transcript = transcribe_webm(audio_bytes)
+    transcript = await transcribe_upload(audio_bytes)
+
+    if req.stream:
+        return StreamingResponse(
+            stream_events(session_id, transcript, speak=True, transcript=transcript),
+            media_type="text/event-stream",
+        )
 
-    engine = sessions[session_id]
-    response = engine.generate_response(transcript)
+    async with session_manager.session(session_id) as engine:
+        response = await engine.agenerate_response(transcript)
 
     return AudioResponse(
         session_id=session_id,
         transcript=transcript,
         response=response,
-        audio_url=None
-    )
\ No newline at end of file
+        response_audio_url=speak_response(response)
+    )
+
+@app.get("/audio/{audio_id}", dependencies=[Depends(verify_api_key)])
+async def get_audio(audio_id: str, request: Request, stream: bool = False):
+    """Spoken response audio (WAV). Supports Range requests; stream=true sends it while it is synthesized."""
+    if stream:
+        chunks = speech_service.open_stream(audio_id)
+        if chunks is None:
+            raise HTTPException(status_code=404, detail="Unknown audio id")
+        return StreamingResponse(chunks, media_type="audio/wav")
+
+    path = await speech_service.wait(audio_id)
+    try:
+        if path is None:
+            raise FileNotFoundError(audio_id)
+        return await range_response(path, request.headers.get("range"))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown audio id")
\ No newline at end of file
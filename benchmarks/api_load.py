@@ -0,0 +1,90 @@
+"""
+Concurrent-request throughput of /chat and /audio.
+
+Start the stub LLM and the API in two terminals, then run the load test:
+    python -m benchmarks.stub_ollama --port 11435
+    OLLAMA_HOST=http://127.0.0.1:11435 uvicorn api:app --port 8000
+    VERA_API_KEY=... python -m benchmarks.api_load --audio sample.webm --concurrency 1 4 16
+
+Postgres must be reachable by the API; Whisper runs for real on /audio.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from metrics import Metrics
+
+
+def post_chat(base_url, api_key, session_id, message):
+    request = urllib.request.Request(
+        f"{base_url}/chat",
+        data=json.dumps({"session_id": session_id, "message": message}).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def post_audio(base_url, api_key, session_id, audio_bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="session_id"\r\n\r\n{session_id}\r\n'
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="audio.webm"\r\n'
+        f"Content-Type: audio/webm\r\n\r\n"
+    ).encode("utf-8") + audio_bytes + f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+    request = urllib.request.Request(
+        f"{base_url}/audio",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}", "Authorization": f"Bearer {api_key}"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def run_level(name, send, concurrency, requests_per_worker):
+    results = Metrics()
+
+    def worker(worker_id):
+        session_id = f"load-{name}-{concurrency}-{worker_id}"
+        for i in range(requests_per_worker):
+            with results.timer("latency"):
+                send(session_id, i)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    s = results.summary("latency")
+    print(f"{name:<6}{concurrency:>6}{s['count'] / elapsed:>12.2f}{s['p50']:>10.3f}{s['p95']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--audio", help="audio file for /audio (skipped if omitted)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=5, help="requests per concurrent client")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("VERA_API_KEY", "")
+    targets = [("chat", lambda session_id, i: post_chat(args.url, api_key, session_id, f"Tell me something new #{i}"))]
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio_bytes = f.read()
+        targets.append(("audio", lambda session_id, i: post_audio(args.url, api_key, session_id, audio_bytes)))
+
+    print(f"{'route':<6}{'conc':>6}{'req/sec':>12}{'p50 (s)':>10}{'p95 (s)':>10}")
+    for name, send in targets:
+        for concurrency in args.concurrency:
+            run_level(name, send, concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+API cold start: time to import api.py, time until the server answers its first
+request (GET /ready), and time until /ready reports every prewarmed component
+loaded, for each VERA_PREWARM setting. Each setting starts a fresh uvicorn
+process; run the stub LLM first so the llama3 warm-up is cheap:
+
+    python -m benchmarks.stub_ollama --port 11435
+    OLLAMA_HOST=http://127.0.0.1:11435 python -m benchmarks.cold_start --prewarm "" whisper "whisper,xtts"
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import api; print(time.perf_counter() - start)"
+
+
+def import_seconds(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def get_ready(url):
+    """(status code, body) of GET /ready, or None while the server is not accepting connections."""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def serve(env, port, timeout):
+    """Seconds from process start to the first answered request and to ready (None on timeout), plus component status."""
+    url = f"http://127.0.0.1:{port}/ready"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    first = ready = None
+    components = {}
+    try:
+        while time.perf_counter() - start < timeout:
+            result = get_ready(url)
+            if result is not None:
+                status, body = result
+                components = body["components"]
+                if first is None:
+                    first = time.perf_counter() - start
+                if status == 200:
+                    ready = time.perf_counter() - start
+                    break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return first, ready, components
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prewarm", nargs="+", default=["", "all"], help="VERA_PREWARM values to compare")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    print(f"{'VERA_PREWARM':<20}{'import (s)':>11}{'first request (s)':>19}{'ready (s)':>11}  loaded components")
+    for setting in args.prewarm:
+        env = dict(os.environ, VERA_PREWARM=setting)
+        imported = import_seconds(env)
+        first, ready, components = serve(env, args.port, args.timeout)
+        loaded = ", ".join(
+            f"{name} {status['load_seconds']:.1f}s" for name, status in components.items() if status["load_seconds"]
+        )
+        print(f"{setting or '-':<20}{imported:>11.2f}{first or float('nan'):>19.2f}"
+              f"{ready or float('nan'):>11.2f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import resource
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB.
+    VmHWM is reset by exec, unlike ru_maxrss, which a subprocess inherits
+    from the parent it was forked from.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
@@ -0,0 +1,83 @@
+"""
+History load at scale: the original fetchall() vs streaming pages through a
+server-side cursor. Each mode runs in a fresh subprocess so peak RSS is
+measured independently.
+
+Point DB_NAME at a scratch database (rows are inserted into `conversations`):
+    DB_NAME=vera_bench python -m benchmarks.history_load --seed 1000000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from benchmarks.common import peak_rss_mb
+
+
+def full_fetch():
+    # The pre-streaming implementation: one query, every row materialized at once
+    import psycopg
+    from psycopg.rows import dict_row
+    from db import DB_PARAMS
+
+    conn = psycopg.connect(**DB_PARAMS)
+    with conn.cursor(row_factory=dict_row) as cursor:
+        cursor.execute("SELECT id, prompt, response FROM conversations;")
+        rows = cursor.fetchall()
+    conn.close()
+    return len(rows)
+
+
+def streamed_fetch():
+    from db import iter_conversations
+
+    return sum(len(page) for page in iter_conversations())
+
+
+MODES = {"full": full_fetch, "streamed": streamed_fetch}
+
+
+def seed(rows):
+    import psycopg
+    from db import DB_PARAMS
+
+    with psycopg.connect(**DB_PARAMS) as conn:
+        conn.execute(
+            "INSERT INTO conversations (prompt, response, created_at) "
+            "SELECT 'prompt number ' || g, repeat('a typical assistant response ', 20) || g, "
+            "now() - (g || ' seconds')::interval FROM generate_series(1, %s) g;",
+            (rows,),
+        )
+    print(f"Inserted {rows} rows")
+
+
+def run_mode(mode):
+    start = time.perf_counter()
+    count = MODES[mode]()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"rows": count, "seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many rows first")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args.mode)
+    if args.seed:
+        seed(args.seed)
+
+    print(f"{'mode':<10}{'rows':>10}{'time (s)':>10}{'peak RSS (MB)':>15}")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.history_load", "--mode", mode],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['rows']:>10}{result['seconds']:>10.2f}{result['peak_rss_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
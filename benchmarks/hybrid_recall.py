@@ -0,0 +1,79 @@
+"""
+Memory recall latency and hit rate across retrieval modes: dense only, hybrid
+(dense + full-text), and lexical_first (hybrid, skipping LLM query expansion
+when full-text hits are strong).
+
+Needs Ollama and Postgres. --seed stores the benchmark facts as conversations
+first (use a scratch DB_NAME):
+    DB_NAME=vera_bench python -m benchmarks.hybrid_recall --seed --turns 20
+"""
+import argparse
+from metrics import Metrics, metrics
+from rerank import RERANK_MODES
+from vector_store import RETRIEVAL_MODES
+
+# (stored prompt, stored response, question, term the recalled memory must contain)
+FACTS = [
+    ("My cat Mellow just turned three!", "Happy birthday to Mellow! Three is a great age for a cat.",
+     "Do you remember my cat Mellow?", "mellow"),
+    ("I switched my TTS to Coqui XTTS yesterday", "Nice, XTTS gives much more natural voices than pyttsx3.",
+     "What was the name of the Python library we talked about for TTS?", "xtts"),
+    ("My landlord is called Mr. Okafor", "Got it, I'll remember Mr. Okafor is your landlord.",
+     "Write an email to my landlord asking to fix the heating", "okafor"),
+    ("I'm flying to Osaka on the 14th", "Exciting! Osaka is famous for its street food in Dotonbori.",
+     "Can you suggest a travel itinerary for my trip?", "osaka"),
+    ("My favourite streamer is xQc", "xQc has a very fast-paced streaming style.",
+     "Which streamer do I like the most?", "xqc"),
+]
+
+
+def seed():
+    from db import store_conversation
+    from vector_store import index_conversation
+
+    for prompt, response, _, _ in FACTS:
+        index_conversation(store_conversation(prompt, response), prompt, response)
+    print(f"Stored {len(FACTS)} benchmark conversations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="store the benchmark facts first")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--rerank-mode", choices=RERANK_MODES, default="similarity")
+    parser.add_argument("--deadline", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.seed:
+        seed()
+
+    from vera_core import VeraEngine
+
+    engines = {
+        mode: VeraEngine(rerank_mode=args.rerank_mode, recall_deadline=args.deadline, retrieval_mode=mode)
+        for mode in RETRIEVAL_MODES
+    }
+    results = Metrics()
+
+    for turn in range(args.turns):
+        _, _, question, expected = FACTS[turn % len(FACTS)]
+        modes = list(engines.items())
+        # Alternate the order so warm caches favour no mode
+        for mode, engine in modes if turn % 2 == 0 else reversed(modes):
+            skipped = metrics.snapshot()["counters"].get("recall.expansion_skipped", 0)
+            with results.timer(mode):
+                context = engine.recall(question)
+            memory = " ".join(m["content"] for m in context if "relevant memories" in m["content"])
+            results.incr(f"{mode}.hits", int(expected in memory.lower()))
+            results.incr(f"{mode}.skipped", metrics.snapshot()["counters"].get("recall.expansion_skipped", 0) - skipped)
+
+    counters = results.snapshot()["counters"]
+    print(f"{'mode':<15}{'p50 (s)':>10}{'p95 (s)':>10}{'mean (s)':>10}{'hit rate':>10}{'expansions skipped':>20}")
+    for mode in engines:
+        s = results.summary(mode)
+        print(f"{mode:<15}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['mean']:>10.3f}"
+              f"{counters.get(f'{mode}.hits', 0) / args.turns:>10.2f}{counters.get(f'{mode}.skipped', 0):>20}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-turn vector-store time of memory search: the original one query call per
+expanded query (re-fetching the collection each time) vs one batched
+query_embeddings call.
+
+Uses a synthetic in-memory Chroma collection, so neither Ollama nor Postgres is needed:
+    python -m benchmarks.memory_search --documents 50000 --queries 5
+"""
+import argparse
+import chromadb
+import numpy as np
+from metrics import Metrics
+
+COLLECTION_NAME = "vera_bench_memory"
+
+
+def unit_vectors(rng, n, dim):
+    vectors = rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_collection(client, n_documents, dim):
+    collection = client.get_or_create_collection(name=COLLECTION_NAME)
+    vectors = unit_vectors(np.random.default_rng(0), n_documents, dim)
+    for offset in range(0, n_documents, 5000):
+        chunk = vectors[offset:offset + 5000]
+        collection.add(
+            ids=[str(offset + i) for i in range(len(chunk))],
+            documents=[f"prompt: synthetic {offset + i} response: ..." for i in range(len(chunk))],
+            embeddings=chunk.tolist(),
+        )
+
+
+def per_query_search(client, query_embeddings, results_per_query):
+    # The pre-batching implementation
+    for query_embedding in query_embeddings:
+        vector_store = client.get_collection(name=COLLECTION_NAME)
+        vector_store.query(query_embeddings=[query_embedding.tolist()], n_results=results_per_query)
+
+
+def batched_search(client, query_embeddings, results_per_query):
+    vector_store = client.get_or_create_collection(name=COLLECTION_NAME)
+    vector_store.query(query_embeddings=query_embeddings.tolist(), n_results=results_per_query)
+
+
+MODES = {"per_query": per_query_search, "batched": batched_search}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=5, help="expanded queries per turn")
+    parser.add_argument("--results-per-query", type=int, default=2)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    build_collection(client, args.documents, args.dim)
+    rng = np.random.default_rng(1)
+    results = Metrics()
+
+    for turn in range(args.turns):
+        query_embeddings = unit_vectors(rng, args.queries, args.dim)
+        modes = list(MODES.items())
+        # Alternate the order so caches favour neither
+        for name, search in modes if turn % 2 == 0 else reversed(modes):
+            with results.timer(name):
+                search(client, query_embeddings, args.results_per_query)
+
+    print(f"{args.documents} documents, {args.queries} queries per turn, {args.turns} turns\n")
+    print(f"{'mode':<12}{'p50 (ms)':>10}{'p95 (ms)':>10}{'mean (ms)':>11}")
+    for name in MODES:
+        s = results.summary(name)
+        print(f"{name:<12}{s['p50'] * 1000:>10.2f}{s['p95'] * 1000:>10.2f}{s['mean'] * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Startup cost of the Twitch message corpus: the old pickled .npy object array
+vs the memory-mapped MessageStore. Each format is loaded in a fresh
+subprocess, followed by one top-k lookup, to measure load time and peak RSS.
+
+    python -m benchmarks.message_store_load --messages 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import peak_rss_mb
+from message_store import MessageStore
+
+WORDS = ["pog", "kappa", "lul", "gg", "nice", "shot", "wp", "lol", "omegalul", "clip", "it", "that", "monkas", "ez"]
+
+
+def synthetic_messages(n):
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 12, size=n)
+    return [" ".join(rng.choice(WORDS, size=length)) for length in lengths]
+
+
+def load(fmt, path, k):
+    ids = np.random.default_rng(1).integers(0, 1000, size=k)
+    start = time.perf_counter()
+    if fmt == "npy":
+        messages = np.load(path, allow_pickle=True).tolist()
+        hits = [messages[i] for i in ids]
+    else:
+        messages = MessageStore(path)
+        hits = messages.get_many(ids)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"messages": len(messages), "hits": len(hits), "seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--load", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        return load(args.load[0], args.load[1], args.k)
+
+    workdir = tempfile.mkdtemp(prefix="vera_messages_")
+    messages = synthetic_messages(args.messages)
+    npy_path = os.path.join(workdir, "messages.npy")
+    store_path = os.path.join(workdir, "messages")
+    np.save(npy_path, np.array(messages, dtype=object))
+    MessageStore(store_path).append(messages)
+
+    sizes = {
+        "npy": os.path.getsize(npy_path),
+        "store": os.path.getsize(f"{store_path}.bin") + os.path.getsize(f"{store_path}.idx"),
+    }
+    paths = {"npy": npy_path, "store": store_path}
+
+    print(f"{'format':<8}{'messages':>10}{'disk (MB)':>11}{'load (s)':>10}{'peak RSS (MB)':>15}")
+    for fmt, path in paths.items():
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.message_store_load", "--k", str(args.k), "--load", fmt, path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{fmt:<8}{result['messages']:>10}{sizes[fmt] / 1024 ** 2:>11.1f}"
+              f"{result['seconds']:>10.3f}{result['peak_rss_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Recall latency: the original sequential pipeline vs the concurrent VeraEngine.recall.
+
+Needs Ollama and Postgres. Run from the repository root:
+    python -m benchmarks.recall_latency --turns 20 --rerank-mode batch_llm
+"""
+import argparse
+from metrics import Metrics
+from query_builder import create_queries
+from rerank import rerank, RERANK_MODES
+from vector_store import search_memory
+from external_rag_module import twitch_rag
+from vera_core import VeraEngine
+
+PROMPTS = [
+    "Do you remember my cat Mellow?",
+    "Can you suggest a travel itinerary for a week in Japan?",
+    "What was the name of the Python library we talked about for TTS?",
+    "hi",
+    "Write an email to my landlord asking to fix the heating",
+]
+
+
+def sequential_recall(prompt, rerank_mode):
+    queries = create_queries(prompt=prompt)
+    rerank(search_memory(queries), mode=rerank_mode)
+    twitch_rag.get().retrieve(prompt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--rerank-mode", choices=RERANK_MODES, default="batch_llm")
+    parser.add_argument("--deadline", type=float, default=10.0)
+    args = parser.parse_args()
+
+    twitch_rag.get()  # load the index up front so both pipelines query it
+    engine = VeraEngine(rerank_mode=args.rerank_mode, recall_deadline=args.deadline)
+    results = Metrics()
+
+    for turn in range(args.turns):
+        prompt = PROMPTS[turn % len(PROMPTS)]
+        runs = [
+            ("sequential", lambda: sequential_recall(prompt, args.rerank_mode)),
+            ("concurrent", lambda: engine.recall(prompt)),
+        ]
+        # Alternate which pipeline goes first so warm caches favour neither
+        for name, run in runs if turn % 2 == 0 else reversed(runs):
+            with results.timer(name):
+                run()
+
+    print(f"{'pipeline':<12}{'p50 (s)':>10}{'p95 (s)':>10}{'mean (s)':>10}")
+    for name in ("sequential", "concurrent"):
+        s = results.summary(name)
+        print(f"{name:<12}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['mean']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
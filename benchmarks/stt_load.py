@@ -0,0 +1,88 @@
+"""
+Transcription service under concurrent load: queue wait, inference time,
+real-time factor and rejections (429s) for a given worker/batch configuration.
+
+Runs TranscriptionService in-process (no HTTP) on synthetic WAV clips or a real recording:
+    python -m benchmarks.stt_load --workers 1 2 4 --batch-size 1 8 --clients 16 --seconds 4
+    python -m benchmarks.stt_load --audio sample.webm --workers 2 --clients 32
+"""
+import argparse
+import asyncio
+import io
+import time
+import wave
+import numpy as np
+from metrics import metrics
+from transcription_service import SAMPLE_RATE, TranscriptionService, TranscriptionQueueFull
+
+
+def synthetic_wav(seconds):
+    # Syllable-rate amplitude-modulated noise, enough to keep the decoder busy
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = rng.standard_normal(len(t)) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) * 0.2
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+async def run(service, audio_bytes, clients, requests_per_client):
+    rejected = 0
+
+    async def client():
+        nonlocal rejected
+        for _ in range(requests_per_client):
+            try:
+                await service.transcribe(audio_bytes)
+            except TranscriptionQueueFull:
+                rejected += 1
+                await asyncio.sleep(0.5)  # honour Retry-After loosely
+
+    # Warm-up: load the model in every worker before timing
+    await asyncio.gather(*(service.transcribe(audio_bytes) for _ in range(service.workers)))
+    metrics.reset()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="audio file to send instead of synthetic WAV clips")
+    parser.add_argument("--seconds", type=float, default=4.0, help="synthetic clip length")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=4, help="requests per client")
+    args = parser.parse_args()
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio_bytes = f.read()
+    else:
+        audio_bytes = synthetic_wav(args.seconds)
+
+    print(f"{'workers':>7}{'batch':>6}{'req/s':>8}{'rejected':>10}{'wait p50/p95 (s)':>18}"
+          f"{'infer p50/p95 (s)':>19}{'RTF':>7}{'mean batch':>12}")
+    for workers in args.workers:
+        for batch_size in args.batch_size:
+            service = TranscriptionService(workers=workers, queue_size=args.queue_size, batch_size=batch_size)
+            elapsed, rejected = asyncio.run(run(service, audio_bytes, args.clients, args.requests))
+            service._pool.shutdown()
+
+            done = args.clients * args.requests - rejected
+            wait, infer = metrics.summary("stt.queue_wait"), metrics.summary("stt.inference")
+            rtf, batch = metrics.summary("stt.real_time_factor"), metrics.summary("stt.batch_size")
+            print(f"{workers:>7}{batch_size:>6}{done / elapsed:>8.2f}{rejected:>10}"
+                  f"{wait['p50']:>9.2f}/{wait['p95']:<8.2f}{infer['p50']:>10.2f}/{infer['p95']:<8.2f}"
+                  f"{rtf['mean']:>7.3f}{batch['mean']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Stub Ollama server for load tests: answers /api/chat, /api/generate (model
+warm-up only), /api/embed and /api/embeddings with fixed latencies instead of running real models.
+
+    python -m benchmarks.stub_ollama --port 11435 --prefill-delay 0.2 --token-delay 0.02
+
+Then point Vera at it with OLLAMA_HOST=http://127.0.0.1:11435.
+"""
+import argparse
+import hashlib
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+
+def fake_embedding(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).tolist()
+
+
+def make_handler(prefill_delay, token_delay, tokens, embed_delay):
+
+    class StubOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+            if self.path == "/api/embeddings":
+                time.sleep(embed_delay)
+                return self._send_json({"embedding": fake_embedding(request["prompt"])})
+
+            if self.path == "/api/embed":
+                inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                time.sleep(embed_delay)
+                return self._send_json({"embeddings": [fake_embedding(text) for text in inputs]})
+
+            if self.path == "/api/generate":
+                return self._send_json({"model": request.get("model"), "response": "", "done": True})
+
+            if self.path != "/api/chat":
+                self.send_error(404)
+                return
+
+            time.sleep(prefill_delay)
+            content = '{"relevant": []}' if request.get("format") == "json" else "stub"
+            done = {
+                "model": request.get("model"),
+                "done": True,
+                "prompt_eval_count": 100,
+                "prompt_eval_duration": int(prefill_delay * 1e9),
+                "eval_count": tokens,
+                "eval_duration": int(max(token_delay * tokens, 1e-9) * 1e9),
+            }
+
+            if not request.get("stream", True):
+                return self._send_json({**done, "message": {"role": "assistant", "content": content}})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_chunk(payload):
+                line = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            for i in range(tokens):
+                time.sleep(token_delay)
+                write_chunk({"done": False, "message": {"role": "assistant", "content": f"tok{i} "}})
+            write_chunk({**done, "message": {"role": "assistant", "content": ""}})
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubOllamaHandler
+
+
+def serve(port=11435, prefill_delay=0.2, token_delay=0.02, tokens=50, embed_delay=0.01):
+    handler = make_handler(prefill_delay, token_delay, tokens, embed_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--prefill-delay", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds per generated token")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per response")
+    parser.add_argument("--embed-delay", type=float, default=0.01, help="seconds per embedding request")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.prefill_delay, args.token_delay, args.tokens, args.embed_delay)
+    print(f"Stub Ollama listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
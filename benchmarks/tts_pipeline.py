@@ -0,0 +1,69 @@
+"""
+Time-to-first-audio of a spoken reply: synthesizing the whole response after
+the LLM has finished vs the sentence pipeline, which synthesizes each sentence
+while tokens are still arriving. The LLM is simulated by streaming a fixed
+reply at --tokens-per-second; audio is synthesized with XTTS but not played.
+
+    python -m benchmarks.tts_pipeline --tokens-per-second 20 --repeats 3
+"""
+import argparse
+import re
+import statistics
+import time
+
+REPLY = (
+    "Sure, here is a quick plan for your week in Japan. "
+    "Spend the first three days in Tokyo, exploring Shibuya, Asakusa and the food markets. "
+    "Then take the bullet train to Kyoto for temples, gardens and a day trip to Nara. "
+    "Finish in Osaka, where the street food alone is worth the visit. "
+    "Let me know if you want hotel suggestions or a rough budget."
+)
+
+
+def tokens(text):
+    # Word-sized chunks with their leading whitespace, like a streamed LLM response
+    return re.findall(r"\s*\S+", text)
+
+
+def stream(text, tokens_per_second):
+    for token in tokens(text):
+        time.sleep(1 / tokens_per_second)
+        yield token
+
+
+def whole(tokens_per_second):
+    from text_to_speech_xtts import synthesize
+
+    start = time.perf_counter()
+    response = "".join(stream(REPLY, tokens_per_second))
+    synthesize(response)
+    return time.perf_counter() - start
+
+
+def pipelined(tokens_per_second):
+    from text_to_speech_xtts import SpeechStream
+
+    speech = SpeechStream(play=False)
+    for token in stream(REPLY, tokens_per_second):
+        speech.feed(token)
+    speech.finish()
+    return speech.time_to_first_audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens-per-second", type=float, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    from text_to_speech_xtts import synthesize
+    synthesize("Warming up.")  # first call pays for speaker conditioning
+
+    print(f"{'mode':<10}{'first audio (s)':>16}")
+    for name, run in (("whole", whole), ("pipelined", pipelined)):
+        seconds = [run(args.tokens_per_second) for _ in range(args.repeats)]
+        print(f"{name:<10}{statistics.median(seconds):>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
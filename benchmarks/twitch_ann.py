@@ -0,0 +1,93 @@
+"""
+Recall@k vs latency vs memory of the Twitch RAG index types against the exact flat index.
+
+Vectors come from an existing flat index or are synthetic:
+    python -m benchmarks.twitch_ann --from-index data/rag/twitch_chat_index.faiss
+    python -m benchmarks.twitch_ann --synthetic 1000000 --dim 768
+"""
+import argparse
+import time
+import faiss
+import numpy as np
+from external_rag_module import create_index, training_size, set_search_params
+
+SWEEPS = {
+    "flat": [{}],
+    "ivf_flat": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "ivf_pq": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "hnsw": [{"ef_search": ef} for ef in (16, 64, 256)],
+}
+
+
+def load_vectors(args):
+    if args.from_index:
+        index = faiss.read_index(args.from_index)
+        return index.reconstruct_n(0, index.ntotal)
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.synthetic, args.dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, n_queries):
+    # Perturbed corpus vectors: realistic neighbourhoods without a held-out set
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), n_queries, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def search_latency(index, queries, k):
+    """Mean single-query latency, matching how TwitchChatRAG.retrieve searches."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        _, I = index.search(query.reshape(1, -1), k)
+        results.append(I[0])
+    return (time.perf_counter() - start) / len(queries), np.array(results)
+
+
+def recall_at_k(approx, exact):
+    k = exact.shape[1]
+    return np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-index", help="existing FAISS index to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=100000, help="number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    queries = make_queries(vectors, args.queries)
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}\n")
+
+    exact = None
+    print(f"{'index':<10}{'params':<16}{'build (s)':>10}{'memory (MB)':>13}{'latency (ms)':>14}{'recall@k':>10}")
+    for index_type, sweep in SWEEPS.items():
+        start = time.perf_counter()
+        index = create_index(vectors.shape[1], index_type, len(vectors), pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        n_train = training_size(index, len(vectors))
+        if n_train:
+            index.train(vectors[np.random.default_rng(2).choice(len(vectors), n_train, replace=False)])
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        memory_mb = len(faiss.serialize_index(index)) / 1024 ** 2
+
+        for params in sweep:
+            set_search_params(index, **params)
+            latency, results = search_latency(index, queries, args.k)
+            if exact is None:
+                exact = results
+            label = ",".join(f"{key}={value}" for key, value in params.items()) or "-"
+            print(f"{index_type:<10}{label:<16}{build_seconds:>10.1f}{memory_mb:>13.1f}"
+                  f"{latency * 1000:>14.3f}{recall_at_k(results, exact):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Per-request /transcribe cost: the original temp-file + ffmpeg-to-wav path vs
+in-memory decoding (ffmpeg pipes, in-process PyAV) straight into Whisper.
+Each mode runs in a fresh subprocess per clip length, so peak RSS is measured
+independently. Needs ffmpeg on PATH to synthesize the webm/opus clips.
+
+    python -m benchmarks.whisper_decode --durations 5 30 300 --repeats 3
+"""
+import argparse
+import functools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import peak_rss_mb
+
+MODES = ("tempfile", "ffmpeg", "pyav")
+
+
+def make_clip(seconds, path):
+    # Speech-band noise shaped into syllable-like bursts, encoded the way browsers upload it
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"anoisesrc=color=pink:duration={seconds}:sample_rate=48000",
+            "-af", "highpass=f=200,lowpass=f=3000,volume='0.5+0.5*sin(2*PI*4*t)':eval=frame",
+            "-c:a", "libopus", "-b:a", "32k", path,
+        ],
+        check=True,
+    )
+
+
+def tempfile_decode(audio_bytes):
+    # The pre-change implementation: write the upload, ffmpeg to a temp wav, read it back
+    from faster_whisper import decode_audio
+
+    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as src:
+        src.write(audio_bytes)
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as dst:
+        pass
+    try:
+        subprocess.run(["ffmpeg", "-y", "-i", src.name, "-ar", "16000", "-ac", "1", dst.name],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return decode_audio(dst.name)
+    finally:
+        os.remove(src.name)
+        os.remove(dst.name)
+
+
+def run_mode(mode, path, repeats):
+    from transcription_service import decode_audio, load_model
+
+    with open(path, "rb") as f:
+        audio_bytes = f.read()
+
+    if mode == "tempfile":
+        decode = tempfile_decode
+    else:
+        decode = functools.partial(decode_audio, decoder=mode)
+
+    model = load_model()
+    decode_seconds = transcribe_seconds = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        audio = decode(audio_bytes)
+        decoded = time.perf_counter()
+        segments, _ = model.transcribe(audio)
+        "".join(segment.text for segment in segments)
+        decode_seconds += decoded - start
+        transcribe_seconds += time.perf_counter() - decoded
+
+    print(json.dumps({
+        "decode": decode_seconds / repeats,
+        "transcribe": transcribe_seconds / repeats,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=int, nargs="+", default=[5, 30, 300], help="clip lengths in seconds")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_mode(args.run[0], args.run[1], args.repeats)
+
+    workdir = tempfile.mkdtemp(prefix="vera_audio_")
+    print(f"{'clip (s)':>8}  {'mode':<10}{'decode (ms)':>12}{'total (ms)':>12}{'peak RSS (MB)':>15}")
+    for seconds in args.durations:
+        path = os.path.join(workdir, f"clip_{seconds}s.webm")
+        make_clip(seconds, path)
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.whisper_decode", "--repeats", str(args.repeats), "--run", mode, path],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            total = result["decode"] + result["transcribe"]
+            print(f"{seconds:>8}  {mode:<10}{result['decode'] * 1000:>12.1f}{total * 1000:>12.1f}"
+                  f"{result['peak_rss_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
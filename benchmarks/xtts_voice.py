@@ -0,0 +1,68 @@
+"""
+Per-utterance XTTS synthesis time: passing speaker_wav on every call (speaker
+conditioning re-derived from the reference clip each time) vs the voice's
+cached conditioning latents. Also reports the one-off cost of computing the
+latents vs loading them from disk.
+
+    python -m benchmarks.xtts_voice --voice vera --repeats 5
+"""
+import argparse
+import statistics
+import time
+
+SENTENCES = [
+    "Sure, I can help with that.",
+    "The bullet train from Tokyo to Kyoto takes a little over two hours.",
+    "Let me know if you want a shorter version of this plan.",
+]
+
+
+def median_seconds(run, repeats):
+    seconds = []
+    for _ in range(repeats):
+        for sentence in SENTENCES:
+            start = time.perf_counter()
+            run(sentence)
+            seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voice", default=None, help="voice name (voices/<name>.wav), default VERA_VOICE")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    import torch
+    import text_to_speech_xtts as xtts
+
+    voice = args.voice or xtts.DEFAULT_VOICE
+    sample = xtts.voice_sample(voice)
+
+    start = time.perf_counter()
+    latents = xtts.compute_latents(sample)
+    compute = time.perf_counter() - start
+    xtts.load_voice(voice)  # make sure the latents are saved
+    start = time.perf_counter()
+    torch.load(f"{xtts.LATENTS_DIR}/{voice}.pt", weights_only=True)
+    load = time.perf_counter() - start
+    del latents
+
+    def speaker_wav(sentence):
+        xtts.tts.get().tts(text=sentence, speaker_wav=sample, language=xtts.LANGUAGE)
+
+    def cached(sentence):
+        xtts.synthesize(sentence, voice)
+
+    cached(SENTENCES[0])  # warm-up
+    print(f"{'conditioning':<28}{'ms':>10}")
+    print(f"{'compute from reference clip':<28}{compute * 1000:>10.1f}")
+    print(f"{'load from disk':<28}{load * 1000:>10.1f}")
+    print()
+    print(f"{'per utterance':<28}{'median ms':>10}")
+    print(f"{'speaker_wav every call':<28}{median_seconds(speaker_wav, args.repeats) * 1000:>10.1f}")
+    print(f"{'cached latents':<28}{median_seconds(cached, args.repeats) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from metrics import metrics
+
+# Components loaded in the background at startup: comma-separated names, or "all"
+PREWARM = [name.strip() for name in os.environ.get("VERA_PREWARM", "").split(",") if name.strip()]
+
+RETRY_BACKOFF = 30        # seconds before a failed component is loaded again in the background
+MAX_RETRY_BACKOFF = 900   # the wait doubles after each failure, up to this
+
+components = {}  # name -> LazyComponent, in registration order
+
+
+class LazyComponent:
+    """
+    A heavy component (model, index, worker pool) built on first use instead
+    of at import. get() runs the factory once, thread-safely; the state
+    (cold / loading / ready / failed) and load time are reported by /ready.
+    Background loads of a failed component back off exponentially; an
+    explicit get() always tries again.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.state = "cold"
+        self.error = None
+        self.load_seconds = None
+        self.failures = 0
+        self.retry_at = 0.0  # monotonic time after which a failed component may be loaded in the background
+        self._value = None
+        self._lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        components[name] = self
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state != "ready":
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.failures += 1
+                    self.retry_at = time.monotonic() + min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** (self.failures - 1))
+                    self.error = str(e)
+                    self.state = "failed"
+                    metrics.incr(f"startup.{self.name}_failed")
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                metrics.observe(f"startup.{self.name}", self.load_seconds)
+                self.failures = 0
+                self.error = None
+                self.state = "ready"
+        return self._value
+
+    def reset(self):
+        """Drop a loaded component that stopped working, so the next get() builds it again."""
+        with self._lock:
+            self._value = None
+            self.load_seconds = None
+            self.state = "cold"
+
+    def get_nowait(self):
+        """
+        The component if it is loaded; otherwise start loading it in the background
+        (unless a failed load is still backing off) and return None.
+        """
+        if self.ready:
+            return self._value
+        self.load_in_background()
+        return None
+
+    def load_in_background(self):
+        """Start a background load if the component is cold, or failed and done backing off."""
+        with self._schedule_lock:
+            retry_due = self.state == "failed" and time.monotonic() >= self.retry_at
+            if self.state == "cold" or retry_due:
+                self.state = "loading"  # so concurrent callers don't start a second load
+                self.prewarm()
+
+    def prewarm(self):
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                print(f"⚠️ Prewarming {self.name} failed: {e}")
+
+        thread = threading.Thread(target=load, name=f"prewarm-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        status = {"state": self.state, "load_seconds": self.load_seconds}
+        if self.error:
+            status["error"] = self.error
+        if self.state == "failed":
+            status["retry_in"] = round(max(0.0, self.retry_at - time.monotonic()), 1)
+        return status
+
+
+def prewarm(names=None):
+    """Load the named components (default PREWARM) in background threads."""
+    names = PREWARM if names is None else names
+    if "all" in names:
+        names = list(components)
+    return [components[name].prewarm() for name in names if name in components]
+
+
+def readiness(required=None):
+    """
+    (all required components ready, status of every registered component).
+    Required components that failed are loaded again once their backoff has passed,
+    e.g. when Ollama came up after the API.
+    """
+    required = PREWARM if required is None else required
+    if "all" in required:
+        required = list(components)
+    for name in required:
+        if name in components and components[name].state == "failed":
+            components[name].load_in_background()
+    ready = all(components[name].ready for name in required if name in components)
+    return ready, {name: component.status() for name, component in components.items()}
@@ -0,0 +1,58 @@
+import math
+import os
+import llm
+
+RESPONSE_TOKENS = int(os.environ.get("VERA_RESPONSE_TOKENS", 1024))       # room left in num_ctx for the reply
+# Whole prompt, capped so prompt and reply fit in the num_ctx sent to Ollama
+CONTEXT_TOKEN_BUDGET = min(int(os.environ.get("VERA_CONTEXT_TOKENS", 6000)), llm.NUM_CTX - RESPONSE_TOKENS)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("VERA_HISTORY_TOKENS", 3000))   # verbatim turns kept before folding
+MESSAGE_OVERHEAD_TOKENS = 4  # role header / separators per chat message
+SUMMARY_PREFIX = "Summary of the earlier conversation with this user:\n"
+
+
+def count_tokens(text):
+    # ~4 characters per token for English with the llama3 tokenizer; good enough for budgeting
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def is_summary(message):
+    return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+
+def fit_recent_turns(turns, budget):
+    """
+    Return the longest suffix of turns that fits in the token budget,
+    never splitting a user message from the assistant reply that follows it.
+    """
+    kept = []
+    used = 0
+    i = len(turns)
+    while i > 0:
+        start = i - 2 if i >= 2 and turns[i - 2]["role"] == "user" else i - 1
+        cost = count_message_tokens(turns[start:i])
+        if used + cost > budget:
+            break
+        kept[:0] = turns[start:i]
+        used += cost
+        i = start
+    return kept
+
+
+def summarize_turns(summary, turns):
+    """Fold turns into the running summary with one LLM call."""
+    summary_msg = (
+        "You maintain a running summary of a conversation between a user and the assistant Vera. "
+        "Update the summary with the new turns. Keep every durable fact about the user "
+        "(names, preferences, plans, pets, projects) and any open questions. "
+        "Be concise, write in the third person, and output only the updated summary."
+    )
+    transcript = "\n".join(f'{m["role"]}: {m["content"]}' for m in turns)
+    response = llm.chat("summarize", [
+        {"role": "system", "content": summary_msg},
+        {"role": "user", "content": f"CURRENT SUMMARY:\n{summary or '(empty)'}\n\nNEW TURNS:\n{transcript}"},
+    ])
+    return response["message"]["content"].strip()
@@ -1,8 +1,17 @@
+import asyncio
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
 import psycopg
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 from colorama import Fore
 from dotenv import load_dotenv
+from metrics import metrics
 
 load_dotenv()
 
@@ -16,37 +25,259 @@ DB_PARAMS = {
     'password': os.environ.get('DB_PASS') or 'change_this_password',
 }
 
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+WRITE_BEHIND = os.environ.get('DB_WRITE_BEHIND', '1') == '1'
+WRITE_BATCH_SIZE = 32      # conversation inserts committed per transaction at most
+WRITE_BATCH_DELAY = 0.02   # seconds to wait for more inserts before committing
+HISTORY_PAGE_SIZE = 1000   # rows per page when streaming conversation history
+
+INSERT_CONVERSATION = "INSERT INTO conversations (prompt, response) VALUES (%s, %s) RETURNING id;"
+DELETE_LAST_CONVERSATION = "DELETE FROM conversations WHERE id = (SELECT MAX(id) FROM conversations) RETURNING id;"
+# Any-term full-text match ranked by cover density; coverage is the share of the
+# query's lexemes found in the conversation
+SEARCH_CONVERSATIONS = """
+SELECT id, prompt, response, rank,
+       (SELECT count(*) FROM unnest(lexemes) AS l WHERE l = ANY(tsvector_to_array(search_vector)))::float
+           / greatest(cardinality(lexemes), 1) AS coverage
+FROM (
+    SELECT c.id, c.prompt, c.response, c.search_vector, q.lexemes,
+           ts_rank_cd(c.search_vector, q.query, 32) AS rank
+    FROM conversations c,
+         (SELECT replace(plainto_tsquery('english', %(text)s)::text, '&', '|')::tsquery AS query,
+                 tsvector_to_array(to_tsvector('english', %(text)s)) AS lexemes) q
+    WHERE c.search_vector @@ q.query
+    ORDER BY rank DESC
+    LIMIT %(limit)s
+) top;
+"""
+
+_pool = None
+_async_pool = None
+_async_pool_open = None
+_pool_lock = threading.Lock()
+
 
 def connect_db():
     return psycopg.connect(**DB_PARAMS)
 
 
-def fetch_conversations():
-    conn = connect_db()
-    with conn.cursor(row_factory=dict_row) as cursor:
-        cursor.execute("SELECT id, prompt, response FROM conversations;")
-        rows = cursor.fetchall()
-    conn.close()
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(kwargs=DB_PARAMS, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, open=True)
+    return _pool
+
+
+async def get_async_pool():
+    global _async_pool, _async_pool_open
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(kwargs=DB_PARAMS, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, open=False)
+        _async_pool_open = asyncio.ensure_future(_async_pool.open())
+    await _async_pool_open
+    return _async_pool
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a pooled connection; committed on exit unless an exception is raised."""
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        metrics.observe("db.pool_wait", time.perf_counter() - start)
+        yield conn
+
+
+@asynccontextmanager
+async def apooled_connection():
+    start = time.perf_counter()
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        metrics.observe("db.pool_wait", time.perf_counter() - start)
+        yield conn
+
+
+def execute(cursor, name, query, params=()):
+    with metrics.timer(f"db.query.{name}"):
+        cursor.execute(query, params, prepare=True)
+
+
+async def aexecute(cursor, name, query, params=()):
+    with metrics.timer(f"db.query.{name}"):
+        await cursor.execute(query, params, prepare=True)
+
+
+class ConversationWriter:
+    """
+    Write-behind batching of conversation inserts.
+    Callers get a Future for the new row id; a background thread commits
+    whatever inserts arrived within WRITE_BATCH_DELAY in one transaction.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, batch_delay=WRITE_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt, response):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((future, prompt, response))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _insert(rows):
+        with pooled_connection() as conn, conn.cursor() as cursor:
+            ids = []
+            for _, prompt, response in rows:
+                execute(cursor, "store_conversation", INSERT_CONVERSATION, (prompt, response))
+                ids.append(cursor.fetchone()[0])
+        return ids
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                ids = self._insert(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][0].set_exception(e)
+                    continue
+                # One bad row (e.g. a NUL byte in the text) aborts the whole transaction:
+                # insert the rows one by one so only that row's caller gets the error
+                metrics.incr("db.write_batch_retried")
+                for row in batch:
+                    try:
+                        row[0].set_result(self._insert([row])[0])
+                    except Exception as row_error:
+                        row[0].set_exception(row_error)
+                continue
+
+            metrics.observe("db.write_batch_size", len(batch))
+            for (future, _, _), conversation_id in zip(batch, ids):
+                future.set_result(conversation_id)
+
+
+conversation_writer = ConversationWriter()
+
+
+def iter_conversations(after_id=0, since=None, until=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Stream conversations in id order, one page (list of row dicts) at a time,
+    through a named server-side cursor so the full table is never held in memory.
+    Filter by id > after_id and/or a created_at range [since, until).
+    """
+    conditions = ["id > %s"]
+    params = [after_id]
+    if since is not None:
+        conditions.append("created_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("created_at < %s")
+        params.append(until)
+
+    query = f"SELECT id, prompt, response, created_at FROM conversations WHERE {' AND '.join(conditions)} ORDER BY id;"
+    with pooled_connection() as conn, conn.cursor(name="iter_conversations", row_factory=dict_row) as cursor:
+        cursor.itersize = page_size
+        with metrics.timer("db.query.iter_conversations"):
+            cursor.execute(query, params)
+        while True:
+            with metrics.timer("db.query.iter_conversations.page"):
+                page = cursor.fetchmany(page_size)
+            if not page:
+                break
+            yield page
+
+
+def fetch_conversations(after_id=0):
+    rows = [row for page in iter_conversations(after_id=after_id) for row in page]
     print(Fore.BLUE + f'Fetched {len(rows)} conversations from the database.')
     return rows
 
 
+def search_conversations(texts, limit=5):
+    """
+    Full-text search of the conversations table, one ranked list of row dicts
+    (id, prompt, response, rank, coverage) per text.
+    """
+    results = []
+    with pooled_connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+        for text in texts:
+            execute(cursor, "search_conversations", SEARCH_CONVERSATIONS, {"text": text, "limit": limit})
+            results.append(cursor.fetchall())
+    return results
+
+
 def store_conversation(prompt, response):
-    conn = connect_db()
-    with conn.cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO conversations (prompt, response) VALUES (%s, %s);",
-            (prompt, response),
-        )
-        conn.commit()
-    conn.close()
+    if WRITE_BEHIND:
+        return conversation_writer.submit(prompt, response).result()
+
+    with pooled_connection() as conn, conn.cursor() as cursor:
+        execute(cursor, "store_conversation", INSERT_CONVERSATION, (prompt, response))
+        return cursor.fetchone()[0]
 
 
 def remove_last_conversation():
-    conn = connect_db()
-    with conn.cursor() as cursor:
-        cursor.execute(
-            "DELETE FROM conversations WHERE id = (SELECT MAX(id) FROM conversations);"
+    with pooled_connection() as conn, conn.cursor() as cursor:
+        execute(cursor, "remove_last_conversation", DELETE_LAST_CONVERSATION)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+async def astore_conversation(prompt, response):
+    if WRITE_BEHIND:
+        return await asyncio.wrap_future(conversation_writer.submit(prompt, response))
+
+    async with apooled_connection() as conn, conn.cursor() as cursor:
+        await aexecute(cursor, "store_conversation", INSERT_CONVERSATION, (prompt, response))
+        return (await cursor.fetchone())[0]
+
+
+async def aremove_last_conversation():
+    async with apooled_connection() as conn, conn.cursor() as cursor:
+        await aexecute(cursor, "remove_last_conversation", DELETE_LAST_CONVERSATION)
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+async def asave_session(session_id, convo):
+    async with apooled_connection() as conn, conn.cursor() as cursor:
+        await aexecute(
+            cursor, "save_session",
+            "INSERT INTO sessions (session_id, convo, updated_at) VALUES (%s, %s, now()) "
+            "ON CONFLICT (session_id) DO UPDATE SET convo = EXCLUDED.convo, updated_at = EXCLUDED.updated_at;",
+            (session_id, Jsonb(convo)),
         )
-        conn.commit()
-    conn.close()
+
+
+async def aprune_sessions(max_age):
+    """Delete spilled sessions not updated for max_age seconds; returns how many were deleted."""
+    async with apooled_connection() as conn, conn.cursor() as cursor:
+        await aexecute(
+            cursor, "prune_sessions",
+            "DELETE FROM sessions WHERE updated_at < now() - make_interval(secs => %s);",
+            (max_age,),
+        )
+        return cursor.rowcount
+
+
+async def aload_session(session_id):
+    async with apooled_connection() as conn, conn.cursor() as cursor:
+        await aexecute(cursor, "load_session", "SELECT convo FROM sessions WHERE session_id = %s;", (session_id,))
+        row = await cursor.fetchone()
+    return row[0] if row else None
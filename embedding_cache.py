@@ -0,0 +1,249 @@
+import fcntl
+import hashlib
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import metrics
+
+CACHE_DIR = "data/cache/embeddings"
+MEMORY_CAPACITY = 20000  # vectors kept in the in-memory LRU layer
+KEY_BYTES = 32           # sha256 digest per row
+KEY_HEADER = struct.Struct("<8sI20x")  # magic + vector dimension, padded to one key record
+KEY_MAGIC = b"VERAKEY1"
+MERGE_FRACTION = 0.125   # new keys are merged into the sorted index once they reach this share of it
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model name, sha256 of text).
+
+    Each model gets an append-only float32 vector file that is memory-mapped
+    for reads, plus a key file with the text hash of every row, so the
+    cache survives restarts without any warm-up. A bounded LRU dict sits in
+    front of the memory map for the hottest vectors. Hits, misses and
+    evictions are reported in /metrics as embedding_cache.*.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_capacity=MEMORY_CAPACITY):
+        self.cache_dir = cache_dir
+        self.memory_capacity = memory_capacity
+        self._lru = OrderedDict()
+        self._models = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _store(self, model):
+        store = self._models.get(model)
+        if store is None:
+            slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+            store = _ModelStore(
+                vectors_path=os.path.join(self.cache_dir, f"{slug}.f32"),
+                keys_path=os.path.join(self.cache_dir, f"{slug}.sha"),
+                lock_path=os.path.join(self.cache_dir, f"{slug}.lock"),
+            )
+            # Key files of older versions were text ("<hex key>\t<row>" lines)
+            legacy_keys_path = os.path.join(self.cache_dir, f"{slug}.keys")
+            if os.path.exists(legacy_keys_path):
+                store.convert_legacy_keys(legacy_keys_path)
+            self._models[model] = store
+        return store
+
+    def _remember(self, model, key, vector):
+        self._lru[(model, key)] = vector
+        self._lru.move_to_end((model, key))
+        while len(self._lru) > self.memory_capacity:
+            self._lru.popitem(last=False)
+            metrics.incr("embedding_cache.evicted")
+
+    def get_many(self, model, texts):
+        """
+        Look up texts for a model.
+        Returns a list aligned with texts holding a vector or None for misses.
+        """
+        with self._lock:
+            store = self._store(model)
+            found = []
+            for text in texts:
+                key = self._key(text)
+                vector = self._lru.get((model, key))
+                if vector is None:
+                    vector = store.get(key)
+                if vector is not None:
+                    self._remember(model, key, vector)
+                found.append(vector)
+
+            hits = sum(vector is not None for vector in found)
+            metrics.incr("embedding_cache.hit", hits)
+            metrics.incr("embedding_cache.miss", len(found) - hits)
+            metrics.gauge("embedding_cache.memory_entries", len(self._lru))
+            return found
+
+    def put_many(self, model, texts, vectors):
+        with self._lock:
+            items = []
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                vector = np.asarray(vector, dtype="float32")
+                items.append((key, vector))
+                self._remember(model, key, vector)
+            store = self._store(model)
+            store.put_many(items)
+            metrics.gauge(f"embedding_cache.disk_entries.{model}", len(store))
+
+
+class _ModelStore:
+    """
+    Append-only vector file for a single model, read through np.memmap, and a
+    key file holding the 32-byte text hash of row i at record i (after a header
+    record with the dimension). Vectors are written before their keys, so a
+    crash can only leave unreferenced rows behind, which the next append drops.
+
+    Lookups never load the keys into Python objects: the first 8 bytes of every
+    hash are kept as a sorted uint64 array searched with np.searchsorted, and
+    candidate rows are confirmed against the full hash in the memory-mapped key
+    file. Keys appended since the last merge sit in a small dict.
+
+    Appends hold an flock on lock_path, so processes sharing the cache
+    directory append one at a time.
+    """
+
+    def __init__(self, vectors_path, keys_path, lock_path):
+        self.vectors_path = vectors_path
+        self.keys_path = keys_path
+        self.lock_path = lock_path
+        self.dim = None
+        self._vectors = None
+        self._keys = None                            # (rows, KEY_BYTES) uint8 memmap
+        self._sorted = np.empty(0, dtype="uint64")   # key prefixes of rows [0, indexed), sorted
+        self._order = np.empty(0, dtype="int64")     # row of each sorted prefix
+        self._indexed = 0                            # rows in the sorted index
+        self._rows = 0                               # rows known, indexed or in _recent
+        self._recent = {}                            # key -> row for rows appended since the last merge
+        self._refresh()
+
+    def __len__(self):
+        return self._rows
+
+    @staticmethod
+    def _prefixes(keys):
+        return np.ascontiguousarray(keys[:, :8]).view("<u8").ravel()
+
+    def _refresh(self):
+        """Pick up rows appended since the last refresh, including those of other processes."""
+        if not os.path.exists(self.keys_path) or os.path.getsize(self.keys_path) < KEY_BYTES:
+            return
+        if self.dim is None:
+            with open(self.keys_path, "rb") as f:
+                magic, self.dim = KEY_HEADER.unpack(f.read(KEY_BYTES))
+            if magic != KEY_MAGIC:
+                raise ValueError(f"Not an embedding cache key file: {self.keys_path}")
+
+        rows = os.path.getsize(self.keys_path) // KEY_BYTES - 1
+        if rows == self._rows:
+            return
+        self._keys = np.memmap(self.keys_path, dtype="uint8", mode="r", offset=KEY_BYTES, shape=(rows, KEY_BYTES))
+        if rows - self._indexed >= max(1024, MERGE_FRACTION * self._indexed):
+            self._merge(rows)
+        else:
+            for row in range(self._rows, rows):
+                self._recent[self._keys[row].tobytes()] = row
+            self._rows = rows
+
+    def _merge(self, rows):
+        """Fold rows [indexed, rows) into the sorted prefix index; merges grow geometrically, so O(1) amortized per row."""
+        prefixes = self._prefixes(self._keys[self._indexed:rows])
+        order = np.argsort(prefixes, kind="stable")
+        positions = np.searchsorted(self._sorted, prefixes[order])
+        self._sorted = np.insert(self._sorted, positions, prefixes[order])
+        self._order = np.insert(self._order, positions, self._indexed + order)
+        self._indexed = self._rows = rows
+        self._recent = {}
+
+    def _row(self, key):
+        row = self._recent.get(key)
+        if row is not None:
+            return row
+        prefix = np.frombuffer(key[:8], dtype="<u8")[0]
+        start = np.searchsorted(self._sorted, prefix, side="left")
+        end = np.searchsorted(self._sorted, prefix, side="right")
+        for row in self._order[start:end]:
+            if self._keys[row].tobytes() == key:
+                return int(row)
+        return None
+
+    def _remap(self):
+        rows = len(self)
+        self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(rows, self.dim)) if rows else None
+
+    def get(self, key):
+        row = self._row(key)
+        if row is None:
+            return None
+        if self._vectors is None or row >= self._vectors.shape[0]:
+            self._remap()
+            if self._vectors is None or row >= self._vectors.shape[0]:
+                return None
+        return np.array(self._vectors[row])
+
+    def put_many(self, items):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released when the lock file is closed
+            # Pick up rows other processes appended since we last looked
+            self._refresh()
+            items = list({key: vector for key, vector in items if self._row(key) is None}.items())
+            if not items:
+                return
+
+            if self.dim is None:
+                self.dim = items[0][1].shape[0]
+                with open(self.keys_path, "wb") as f:
+                    f.write(KEY_HEADER.pack(KEY_MAGIC, self.dim))
+            for _, vector in items:
+                if vector.shape[0] != self.dim:
+                    raise ValueError(f"Embedding dimension changed from {self.dim} to {vector.shape[0]}")
+
+            # Row i belongs to key record i: drop unreferenced rows and partial records first
+            first_row = len(self)
+            if os.path.exists(self.vectors_path):
+                os.truncate(self.vectors_path, min(os.path.getsize(self.vectors_path), first_row * self.dim * 4))
+            os.truncate(self.keys_path, (first_row + 1) * KEY_BYTES)
+
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.vstack([vector for _, vector in items]).astype("float32").tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(key for key, _ in items))
+            self._refresh()
+
+    def convert_legacy_keys(self, legacy_keys_path):
+        """Rewrite a text key file of an older version in the binary format, then delete it."""
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(legacy_keys_path):
+                return  # converted by another process meanwhile
+            rows = {}
+            with open(legacy_keys_path, "r", encoding="utf-8") as f:
+                header = f.readline().strip()
+                for line in f:
+                    key, _, row = line.rstrip("\n").partition("\t")
+                    if row and line.endswith("\n"):
+                        rows[int(row)] = bytes.fromhex(key)
+            if header and rows:
+                # Rows without a key (left by a crash) get an all-zero hash that matches no text
+                keys = bytearray(KEY_HEADER.pack(KEY_MAGIC, int(header)))
+                for row in range(max(rows) + 1):
+                    keys += rows.get(row, bytes(KEY_BYTES))
+                with open(f"{self.keys_path}.tmp", "wb") as f:
+                    f.write(keys)
+                os.replace(f"{self.keys_path}.tmp", self.keys_path)
+            os.remove(legacy_keys_path)
+            self._refresh()
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from llm import client, KEEP_ALIVE
+from tqdm import tqdm
+from embedding_cache import embedding_cache
+
+EMBEDDING_MODEL = "nomic-embed-text"
+BATCH_SIZE = 64       # texts per embedding request / per vector store add()
+MAX_CONCURRENCY = 8   # parallel requests when the backend has no batch endpoint
+# Stored with persisted indexes; version 1 (no marker) predates unit-normalized vectors
+EMBEDDING_VERSION = 2
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="embed")
+
+
+def _normalize(vectors):
+    # /api/embed returns unit vectors while /api/embeddings does not;
+    # normalize both so every index sees the same geometry
+    vectors = np.asarray(vectors, dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _embed_request(texts, model):
+    # ollama>=0.3 exposes /api/embed, which accepts a list of inputs in one request
+    if hasattr(client, "embed"):
+        return client.embed(model=model, input=texts, keep_alive=KEEP_ALIVE)["embeddings"]
+
+    # Older clients: one request per text, a bounded number in flight at once
+    return list(_executor.map(
+        lambda text: client.embeddings(model=model, prompt=text, keep_alive=KEEP_ALIVE)["embedding"],
+        texts,
+    ))
+
+
+def embed_texts(texts, model=EMBEDDING_MODEL, batch_size=BATCH_SIZE):
+    """
+    Embed a list of texts in batches.
+    Texts already in the embedding cache are not sent to the backend.
+    Returns a float32 array of shape (len(texts), dim).
+    """
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype="float32")
+
+    vectors = embedding_cache.get_many(model, texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+
+    if missing:
+        computed = np.vstack([
+            _normalize(_embed_request(missing[i:i + batch_size], model))
+            for i in range(0, len(missing), batch_size)
+        ])
+        embedding_cache.put_many(model, missing, computed)
+        by_text = dict(zip(missing, computed))
+        vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    return np.vstack(vectors)
+
+
+def embed_text(text, model=EMBEDDING_MODEL):
+    return embed_texts([text], model=model)[0]
+
+
+def iter_embedded_chunks(texts, chunk_size=BATCH_SIZE, desc="Embedding", model=EMBEDDING_MODEL):
+    """
+    Embed texts chunk by chunk so callers can add() each chunk to their index
+    as soon as it is ready. Yields (offset, texts_chunk, embeddings_chunk) and
+    reports throughput in texts/sec.
+    """
+    texts = list(texts)
+    start = time.perf_counter()
+
+    with tqdm(total=len(texts), desc=desc, unit="text") as bar:
+        for offset in range(0, len(texts), chunk_size):
+            chunk = texts[offset:offset + chunk_size]
+            vectors = embed_texts(chunk, model=model, batch_size=chunk_size)
+            bar.update(len(chunk))
+            bar.set_postfix(texts_per_sec=f"{bar.n / (time.perf_counter() - start):.1f}")
+            yield offset, chunk, vectors
+
+    elapsed = time.perf_counter() - start
+    if texts:
+        print(f"{desc}: {len(texts)} texts in {elapsed:.1f}s ({len(texts) / elapsed:.1f} texts/sec)")
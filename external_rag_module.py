@@ -1,75 +1,422 @@
+import itertools
+import json
+import math
 import os
-import ollama
+import time
 import faiss
 import numpy as np
-from tqdm import tqdm
 from datasets import load_dataset
+from tqdm import tqdm
+from components import LazyComponent
+from embeddings import BATCH_SIZE, EMBEDDING_VERSION, embed_text, embed_texts
+from message_store import MessageStore
+from metrics import metrics
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+DATASET_NAME = "lparkourer10/twitch_chat"
+DATASET_SOURCE = f"dataset:{DATASET_NAME}"
+DEFAULT_EXPECTED_MESSAGES = 1_000_000  # sizes IVF indexes when the corpus size is unknown
+# Shared instance settings
+TWITCH_INDEX_TYPE = os.environ.get("VERA_TWITCH_INDEX", "flat")
+TWITCH_MMAP = os.environ.get("VERA_TWITCH_MMAP", "1") == "1"
+TWITCH_MAX_MESSAGES = int(os.environ.get("VERA_TWITCH_MAX_MESSAGES", 10000)) or None  # 0 = whole dataset
+TWITCH_NPROBE = int(os.environ.get("VERA_TWITCH_NPROBE", 16))
+TWITCH_EF_SEARCH = int(os.environ.get("VERA_TWITCH_EF_SEARCH", 64))
+CHECKPOINT_GROWTH = 0.25  # checkpoint no more often than every 25% of index growth, keeping checkpoint I/O linear
+
+
+def default_nlist(n_vectors):
+    # ~4*sqrt(N) inverted lists, with at least 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def create_index(dim, index_type="flat", n_vectors=0, nlist=None, pq_m=64, hnsw_m=32):
+    """
+    Create an empty FAISS index.
+
+    index_type:
+        "flat"     - exact brute-force L2 scan
+        "ivf_flat" - inverted lists over full vectors, needs training
+        "ivf_pq"   - inverted lists over product-quantized codes (pq_m bytes/vector), needs training
+        "hnsw"     - graph index with hnsw_m links per node, no training
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    nlist = nlist or default_nlist(n_vectors)
+    description = {
+        "flat": "Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}",
+        "hnsw": f"HNSW{hnsw_m},Flat",
+    }[index_type]
+    return faiss.index_factory(dim, description, faiss.METRIC_L2)
+
+
+def training_size(index, n_vectors):
+    """Number of vectors to collect before training (0 if the index needs none)."""
+    if index.is_trained:
+        return 0
+    nlist = faiss.extract_index_ivf(index).nlist
+    # PQ codebooks want ~10k points, IVF centroids ~39 per list
+    return min(n_vectors, max(39 * nlist, 10000))
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Apply the recall/latency knobs: nprobe for IVF indexes, efSearch for HNSW."""
+    if nprobe is not None:
+        try:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+        except RuntimeError:
+            pass  # not an IVF index
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def read_index(path, mmap=True):
+    """Load an index from disk, memory-mapping it when the index type allows."""
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def clean_message(message):
+    """Normalize a raw chat message, or return None if it should be skipped (bot commands, etc.)."""
+    if not message or message.startswith(("!", "%", "[")):
+        return None
+    return message.lower().strip()
+
 
 class TwitchChatRAG:
-    def __init__(self, 
-                 index_path="data/rag/twitch_chat_index.faiss",
-                 messages_path="data/rag/twitch_chat_messages.npy",
+    def __init__(self,
+                 index_path=None,
+                 messages_path="data/rag/twitch_chat_messages",
                  k=5,
-                 max_messages=10000):
+                 max_messages=10000,
+                 index_type="flat",
+                 nlist=None,
+                 pq_m=64,
+                 hnsw_m=32,
+                 nprobe=16,
+                 ef_search=64,
+                 mmap=True,
+                 chunk_size=512,
+                 checkpoint_every=20):
+        """
+        max_messages: corpus cap, None for the whole dataset.
+        index_type: one of INDEX_TYPES; nlist/pq_m/hnsw_m shape the index at build time,
+        nprobe/ef_search trade recall for latency at query time.
+        mmap: memory-map the on-disk index instead of reading it into RAM.
+        messages_path: prefix of the MessageStore files (.bin/.idx).
+        chunk_size / checkpoint_every: messages embedded per chunk, and chunks between
+        checkpoints of the index and message store while building (at least; large
+        indexes are checkpointed after every CHECKPOINT_GROWTH of growth).
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        if index_path is None:
+            suffix = "" if index_type == "flat" else f"_{index_type}"
+            index_path = f"data/rag/twitch_chat_index{suffix}.faiss"
         self.index_path = index_path
         self.messages_path = messages_path
+        self.checkpoint_path = f"{index_path}.checkpoint.json"
+        self.meta_path = f"{index_path}.meta.json"
+        self.partial_index_path = f"{index_path}.partial"
         self.k = k
+        self.index_type = index_type
+        self.index_params = {"nlist": nlist, "pq_m": pq_m, "hnsw_m": hnsw_m}
+        self.search_params = {"nprobe": nprobe, "ef_search": ef_search}
+        self.chunk_size = chunk_size
+        self.checkpoint_every = checkpoint_every
+        self._untrained = []
+        self._mmapped = False
+
+        # Convert messages saved by older versions as a pickled .npy array
+        legacy_messages_path = f"{messages_path}.npy"
+        if os.path.exists(legacy_messages_path) and not MessageStore.exists(messages_path):
+            print("Converting Twitch chat messages to the compact message store...")
+            MessageStore(messages_path).append(np.load(legacy_messages_path, allow_pickle=True).tolist())
+            os.remove(legacy_messages_path)
+
+        # Resume an interrupted build or append from its last checkpoint
+        checkpoint = self._restore_checkpoint()
+        if checkpoint is not None and checkpoint["source"] != DATASET_SOURCE:
+            print(f"⚠️ Restored an unfinished append from '{checkpoint['source']}'; call add_messages() again to finish it")
+            return
 
         # Load existing index if exists
-        if os.path.exists(index_path) and os.path.exists(messages_path):
+        if (checkpoint is None and os.path.exists(index_path) and MessageStore.exists(messages_path)
+                and self._check_embedding_version()):
             print("📦 Loading existing Twitch Chat FAISS index...")
-            self.index = faiss.read_index(index_path)
-            self.messages = np.load(messages_path, allow_pickle=True).tolist()
+            self.index = read_index(index_path, mmap=mmap)
+            self._mmapped = mmap
+            set_search_params(self.index, **self.search_params)
+            self.messages = MessageStore(messages_path)
+            # Messages are stored before the index is saved: drop any the saved index never got
+            self.messages.truncate(self.index.ntotal)
             print(f"✅ Loaded {len(self.messages)} messages from disk")
             return
 
-        # Load dataset from Hugging Face
+        # Stream the dataset from Hugging Face instead of materializing the column
         print("Loading Twitch chat dataset...")
-        dataset = load_dataset("lparkourer10/twitch_chat", split="train")
-        print(f"Dataset loaded: {len(dataset)} messages")
-
-        # Clean & limit messages
-        self.messages = [
-            m.lower().strip()
-            for m in dataset["Message"]
-            if m and not m.startswith(("!", "%", "["))
-        ][:max_messages]
-        
-        # Create or load FAISS index
+        dataset = load_dataset(DATASET_NAME, split="train", streaming=True)
+        if checkpoint is None:
+            self.index = None
+            if MessageStore.exists(messages_path):
+                os.remove(f"{messages_path}.bin")
+                os.remove(f"{messages_path}.idx")
+            self.messages = MessageStore(messages_path)
+            consumed = 0
+        else:
+            consumed = checkpoint["consumed"]
+            dataset = dataset.skip(consumed)
+
+        self._ingest(
+            (row["Message"] for row in dataset),
+            source=DATASET_SOURCE,
+            consumed=consumed,
+            limit=max_messages,
+            expected=max_messages or self._dataset_size(dataset),
+        )
         if len(self.messages) == 0:
             raise ValueError("No messages found after cleaning!")
-        
-        # Create embeddings
-        print("Embedding messages...")
-        embeddings = []
-        for msg in tqdm(self.messages, desc="Embedding messages"):
-            response = ollama.embeddings(
-                model="nomic-embed-text",
-                prompt=msg
-            )
-            embeddings.append(response["embedding"])
-        embeddings = np.array(embeddings).astype("float32")
-        
-        # Create FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings)
-        print(f"FAISS index created with {len(self.messages)} messages.")
-
-        # Optionally save index
-        faiss.write_index(self.index, self.index_path)
-        np.save(self.messages_path, np.array(self.messages))
+        print(f"FAISS {index_type} index created with {len(self.messages)} messages.")
+
+
+    @staticmethod
+    def _dataset_size(dataset):
+        try:
+            return dataset.info.splits["train"].num_examples
+        except (AttributeError, KeyError, TypeError):
+            return None
+
+
+    def _check_embedding_version(self):
+        """
+        Bring a saved index up to EMBEDDING_VERSION. Indexes saved before embeddings
+        were unit-normalized hold raw vectors, whose L2 distances to normalized queries
+        are dominated by their norms: they are normalized in place when the vectors can
+        be read back (flat and HNSW). Returns False if the index must be rebuilt instead.
+        """
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                if json.load(f).get("embedding_version") == EMBEDDING_VERSION:
+                    return True
+
+        index = faiss.read_index(self.index_path)
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        except RuntimeError:
+            print("⚠️ Twitch chat index predates normalized embeddings and can't be read back, rebuilding it")
+            return False
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        if not np.allclose(norms, 1.0, atol=1e-3):
+            print("Normalizing the vectors of an older Twitch chat index...")
+            norms[norms == 0] = 1.0
+            index.reset()
+            index.add(vectors / norms)
+            faiss.write_index(index, f"{self.index_path}.tmp")
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+        self._write_meta()
+        return True
+
+
+    def _write_meta(self):
+        with open(f"{self.meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"embedding_version": EMBEDDING_VERSION, "index_type": self.index_type}, f)
+        os.replace(f"{self.meta_path}.tmp", self.meta_path)
+
+
+    def _restore_checkpoint(self):
+        """
+        Roll the index and message store back to the last checkpoint: the partial
+        index if one was written, else the saved index the checkpointed append started from.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if os.path.exists(self.partial_index_path):
+            self.index = faiss.read_index(self.partial_index_path)
+        elif os.path.exists(self.index_path):
+            self.index = faiss.read_index(self.index_path)
+        else:
+            self.index = None  # a build that never reached its first checkpoint
+        if self.index is not None:
+            set_search_params(self.index, **self.search_params)
+        self._untrained = []
+        self._mmapped = False
+        self.messages = MessageStore(self.messages_path)
+        self.messages.truncate(checkpoint["messages"])
+        print(f"↩️ Resuming from checkpoint: {checkpoint['messages']} messages, "
+              f"{checkpoint['consumed']} rows of '{checkpoint['source']}' consumed")
+        return checkpoint
+
+
+    def _write_checkpoint(self, source, consumed, save_index=True):
+        """
+        Record progress of an ingestion. save_index=False only records the starting
+        point of an append, whose index is the one already saved at index_path.
+        """
+        if save_index:
+            faiss.write_index(self.index, f"{self.partial_index_path}.tmp")
+            os.replace(f"{self.partial_index_path}.tmp", self.partial_index_path)
+        with open(f"{self.checkpoint_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"source": source, "consumed": consumed, "messages": len(self.messages)}, f)
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+
+
+    def _finish(self):
+        """Persist the finished index and drop checkpoint files."""
+        faiss.write_index(self.index, f"{self.index_path}.tmp")
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+        self._write_meta()
+        for path in (self.checkpoint_path, self.partial_index_path):
+            if os.path.exists(path):
+                os.remove(path)
         print("FAISS index and messages saved locally.")
 
 
+    def _add_chunk(self, messages, expected):
+        embeddings = embed_texts(messages, batch_size=BATCH_SIZE)
+        if self.index is None:
+            self.index = create_index(embeddings.shape[1], self.index_type, expected or DEFAULT_EXPECTED_MESSAGES,
+                                      **self.index_params)
+            set_search_params(self.index, **self.search_params)
+
+        # Store order must match index order: message i <-> vector i
+        self.messages.append(messages)
+        if self.index.is_trained:
+            self.index.add(embeddings)
+            return
+
+        # IVF indexes buffer the first chunks until there is enough data to train on
+        self._untrained.append(embeddings)
+        if sum(len(e) for e in self._untrained) >= training_size(self.index, expected or DEFAULT_EXPECTED_MESSAGES):
+            self._train_and_add()
+
+
+    def _train_and_add(self):
+        sample = np.vstack(self._untrained)
+        self._untrained = []
+        print(f"Training FAISS index on {len(sample)} vectors...")
+        self.index.train(sample)
+        self.index.add(sample)
+
+
+    def _ingest(self, raw_messages, source, consumed=0, limit=None, expected=None):
+        """
+        Clean, embed and index raw messages chunk by chunk, checkpointing the
+        index and message store every checkpoint_every chunks, or after the index
+        grew by CHECKPOINT_GROWTH if that is more (each checkpoint rewrites the
+        whole index, so a fixed interval would make checkpointing quadratic).
+        consumed is the number of raw messages of this source already ingested.
+        """
+        chunk = []
+        since_checkpoint = 0
+        start = time.perf_counter()
+        added = 0
+
+        with tqdm(total=limit, initial=len(self.messages), desc="Ingesting messages", unit="msg") as bar:
+            for raw in raw_messages:
+                if limit is not None and len(self.messages) + len(chunk) >= limit:
+                    break
+                consumed += 1
+                message = clean_message(raw)
+                if message is None:
+                    continue
+                chunk.append(message)
+                if len(chunk) < self.chunk_size:
+                    continue
+
+                self._add_chunk(chunk, expected)
+                added += len(chunk)
+                bar.update(len(chunk))
+                bar.set_postfix(texts_per_sec=f"{added / (time.perf_counter() - start):.1f}")
+                since_checkpoint += len(chunk)
+                chunk = []
+                interval = max(self.checkpoint_every * self.chunk_size, CHECKPOINT_GROWTH * len(self.messages))
+                # Only checkpoint once every stored message is in the index
+                if since_checkpoint >= interval and not self._untrained:
+                    self._write_checkpoint(source, consumed)
+                    since_checkpoint = 0
+
+            if chunk:
+                self._add_chunk(chunk, expected)
+                added += len(chunk)
+                bar.update(len(chunk))
+
+        if self._untrained:
+            self._train_and_add()
+        if self.index is not None:
+            self._finish()
+        return added
+
+
+    def add_messages(self, raw_messages, source="append"):
+        """
+        Append new chat messages (any iterable of strings, e.g. an open log file)
+        to the existing index without rebuilding it. Interrupted appends resume
+        when called again with the same source name.
+        Returns the number of messages added.
+        """
+        consumed = 0
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if checkpoint["source"] != source:
+                raise ValueError(f"An unfinished ingestion of '{checkpoint['source']}' must be completed first")
+            # Roll the index and message store back to the checkpoint, dropping
+            # whatever a failed attempt in this process added after it
+            consumed = self._restore_checkpoint()["consumed"]
+        else:
+            if self._mmapped:
+                # Read-only memory map: load a writable copy to add to
+                self.index = faiss.read_index(self.index_path)
+                set_search_params(self.index, **self.search_params)
+                self._mmapped = False
+            # Messages reach the store before the index is saved: mark where this append
+            # starts so a failed or interrupted one can be rolled back
+            self._write_checkpoint(source, consumed, save_index=False)
+
+        added = self._ingest(itertools.islice(raw_messages, consumed, None), source=source, consumed=consumed)
+        print(f"Appended {added} messages, index now holds {len(self.messages)}.")
+        return added
+
+
     def retrieve(self, prompt):
         """
         Retrieve top-k relevant Twitch chat messages for a user prompt.
         Returns a list of messages.
         """
-        response = ollama.embeddings(model="nomic-embed-text", prompt=prompt)
-        query_embedding = response['embedding']
+        query_embedding = embed_text(prompt)
 
-        D, I = self.index.search(np.array([query_embedding]).astype("float32"), self.k)
-        retrieved = [self.messages[i] for i in I[0]]
+        D, I = self.index.search(query_embedding.reshape(1, -1), self.k)
+        # Only the top-k hits are decoded from the message store
+        retrieved = self.messages.get_many(i for i in I[0] if i >= 0)
         return retrieved
+
+
+# Shared instance, built on first use: loading it may download the dataset and embed every message
+twitch_rag = LazyComponent("twitch_rag", lambda: TwitchChatRAG(
+    k=5,
+    max_messages=TWITCH_MAX_MESSAGES,
+    index_type=TWITCH_INDEX_TYPE,
+    nprobe=TWITCH_NPROBE,
+    ef_search=TWITCH_EF_SEARCH,
+    mmap=TWITCH_MMAP,
+))
+
+
+def retrieve_twitch(prompt):
+    """Twitch examples for a prompt; empty while the index is still being built in the background."""
+    rag = twitch_rag.get_nowait()
+    if rag is None:
+        metrics.incr("recall.twitch_not_ready")
+        return []
+    return rag.retrieve(prompt)
@@ -0,0 +1,78 @@
+import os
+import ollama
+from metrics import metrics
+
+LLM_MODEL = os.environ.get("VERA_LLM_MODEL", "llama3")
+# How long Ollama keeps models loaded after a call ("-1" pins them until the server stops)
+KEEP_ALIVE = os.environ.get("VERA_KEEP_ALIVE", "30m")
+# Shared context size, sent with every call: Ollama's default window (2048) would silently cut
+# the front of longer prompts, and calls with a different num_ctx would make it reload the model
+NUM_CTX = int(os.environ.get("VERA_NUM_CTX", 8192))  # llama3's full window
+
+client = ollama.Client()
+async_client = ollama.AsyncClient()
+
+DURATION_FIELDS = {
+    "load_duration": "load",
+    "prompt_eval_duration": "prompt_eval",
+    "eval_duration": "eval",
+    "total_duration": "total",
+}
+
+
+def _options(options=None):
+    merged = {"num_ctx": NUM_CTX}
+    merged.update(options or {})
+    return merged
+
+
+def record_timings(name, response):
+    """
+    Record Ollama's timing metadata for one call (a response or the final stream chunk):
+    llm.<name>.load / .prompt_eval / .eval / .total in seconds, plus token counts.
+    Prefill that hit the server's prompt cache shows up as a small prompt_eval_count.
+    """
+    for field, metric in DURATION_FIELDS.items():
+        if response.get(field):
+            metrics.observe(f"llm.{name}.{metric}", response[field] / 1e9)
+    for field in ("prompt_eval_count", "eval_count"):
+        if field in response:
+            metrics.observe(f"llm.{name}.{field}", response[field])
+
+
+def chat(name, messages, model=LLM_MODEL, options=None, **kwargs):
+    """
+    Non-streaming chat call. name labels the call site in /metrics.
+    Callers keep their static system/few-shot messages first and identical
+    between calls so only the dynamic tail has to be prefilled.
+    """
+    response = client.chat(model=model, messages=messages, options=_options(options), keep_alive=KEEP_ALIVE, **kwargs)
+    record_timings(name, response)
+    return response
+
+
+def stream_chat(name, messages, model=LLM_MODEL, options=None, **kwargs):
+    stream = client.chat(model=model, messages=messages, options=_options(options), keep_alive=KEEP_ALIVE,
+                         stream=True, **kwargs)
+    for chunk in stream:
+        if chunk.get("done"):
+            record_timings(name, chunk)
+        yield chunk
+
+
+async def astream_chat(name, messages, model=LLM_MODEL, options=None, **kwargs):
+    stream = await async_client.chat(model=model, messages=messages, options=_options(options),
+                                     keep_alive=KEEP_ALIVE, stream=True, **kwargs)
+    async for chunk in stream:
+        if chunk.get("done"):
+            record_timings(name, chunk)
+        yield chunk
+
+
+def warm_up(model=LLM_MODEL, embedding_model=None):
+    """Load the models into memory ahead of the first turn; they then stay loaded for KEEP_ALIVE."""
+    with metrics.timer("llm.warm_up"):
+        # An empty prompt only loads the model
+        client.generate(model=model, prompt="", options=_options(), keep_alive=KEEP_ALIVE)
+        if embedding_model:
+            client.embeddings(model=embedding_model, prompt="", keep_alive=KEEP_ALIVE)
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+
+
+class MessageStore:
+    """
+    Compact on-disk store of UTF-8 messages: one file with the concatenated
+    bytes and one uint64 offsets file (message i is bytes[offsets[i]:offsets[i+1]]).
+    Both files are memory-mapped and messages are only decoded when requested,
+    so opening the store costs nothing per message.
+
+    Appends write the bytes before the offsets, so a crash mid-append never
+    exposes a partially written message.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data_path = f"{path}.bin"
+        self.offsets_path = f"{path}.idx"
+        self._data = None
+        self._offsets = None
+
+        if not os.path.exists(self.offsets_path):
+            os.makedirs(os.path.dirname(self.offsets_path) or ".", exist_ok=True)
+            open(self.data_path, "ab").close()
+            np.zeros(1, dtype="uint64").tofile(self.offsets_path)
+        self._remap()
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(f"{path}.idx") and os.path.exists(f"{path}.bin")
+
+    def _remap(self):
+        self._offsets = np.memmap(self.offsets_path, dtype="uint64", mode="r",
+                                  shape=(os.path.getsize(self.offsets_path) // 8,))
+        size = int(self._offsets[-1])
+        self._data = np.memmap(self.data_path, dtype="uint8", mode="r", shape=(size,)) if size else None
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._data[start:end].tobytes().decode("utf-8") if end > start else ""
+
+    def get_many(self, ids):
+        return [self[int(i)] for i in ids]
+
+    def append(self, messages):
+        encoded = [m.encode("utf-8") for m in messages]
+        if not encoded:
+            return
+        end = int(self._offsets[-1])
+        offsets = end + np.cumsum([len(b) for b in encoded], dtype="uint64")
+
+        with open(self.data_path, "r+b") as f:
+            f.seek(end)  # drop bytes of an append that never got its offsets written
+            f.truncate()
+            f.write(b"".join(encoded))
+        with open(self.offsets_path, "r+b") as f:
+            f.seek(len(self._offsets) * 8)  # likewise for a partially written offset
+            f.truncate()
+            f.write(offsets.tobytes())
+        self._remap()
+
+    def truncate(self, n):
+        """Drop every message from index n on (used to roll back to a checkpoint)."""
+        if n >= len(self):
+            return
+        end = int(self._offsets[n])
+        self._data = self._offsets = None
+        os.truncate(self.offsets_path, (n + 1) * 8)
+        os.truncate(self.data_path, end)
+        self._remap()
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+WINDOW_SIZE = 1000  # most recent samples kept per timing
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry: monotonic counters, point-in-time
+    gauges and rolling windows of observations (latencies in seconds, token counts, ...).
+    """
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._samples = defaultdict(lambda: deque(maxlen=self.window_size))
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._samples.clear()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._samples[name].append(value)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def percentile(self, name, q):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+    def summary(self, name):
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return {
+            "count": len(samples),
+            "mean": sum(samples) / len(samples),
+            "p50": self.percentile(name, 50),
+            "p95": self.percentile(name, 95),
+            "max": max(samples),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            names = list(self._samples)
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "observations": {name: self.summary(name) for name in names},
+        }
+
+
+metrics = Metrics()
@@ -1,49 +1,143 @@
-import ast
-import ollama
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from colorama import Fore
+import llm
+from metrics import metrics
 
+QUERY_CACHE_SIZE = int(os.environ.get("VERA_QUERY_CACHE_SIZE", 1024))
+QUERY_NUM_PREDICT = 96      # token cap; a list of a few short queries fits well within it
+MIN_CONTENT_WORDS = 2       # prompts with fewer content words are searched as-is
 
-def create_queries(prompt):
-    query_msg = (
+# Words that carry no search value on their own (greetings, fillers, pronouns, ...)
+LOW_INFORMATION_WORDS = {
+    "a", "an", "the", "and", "or", "but", "so", "to", "of", "in", "on", "at", "for", "with", "is", "are",
+    "was", "be", "it", "its", "this", "that", "i", "im", "me", "my", "you", "your", "we", "do", "does",
+    "did", "can", "could", "would", "will", "please", "hi", "hello", "hey", "yo", "thanks", "thank",
+    "thx", "ok", "okay", "yes", "no", "yeah", "nope", "sure", "cool", "nice", "great", "good", "bye",
+    "lol", "haha", "hmm", "what", "whats", "how", "hows", "why", "who", "when", "where", "up", "sup",
+    "morning", "night", "vera",
+}
+
+QUERY_EXPANSION_MSG = (
     "You are a first-principles reasoning search query AI agent. "
-    "Given the user's prompt, generate a Python list of short search queries "
+    "Given the user's prompt, generate a list of short search queries "
     "that would retrieve any relevant information from the embedding database "
     "of all conversations you have ever had with this user. "
-    "Your output must be ONLY a valid Python list of strings, with no explanations, "
-    "no extra text, and no syntax errors. "
+    'Your output must be ONLY a JSON object of the form {"queries": [list of strings]}, '
+    "with no explanations and no extra text. "
     "Think in terms of concepts, facts, or context necessary to respond accurately."
-    )
+)
+
+# Static prefix, identical on every call so the server can reuse its prompt cache
+QUERY_EXPANSION_PREFIX = [
+    {"role": "system", "content": QUERY_EXPANSION_MSG},
+
+    # Example 1: insurance
+    {"role": "user", "content": "Write an email to my car insurance company and create a persuasive request for them to lower prices based on my good driving record"},
+    {"role": "assistant", "content": '{"queries": ["User name", "Current auto insurance provider", "Driving record", "Insurance policy details"]}'},
+
+    # Example 2: Python voice assistant
+    {"role": "user", "content": "How can I convert the speak function in my Llama3 Python voice assistant to use pyttsx3 instead?"},
+    {"role": "assistant", "content": '{"queries": ["Llama3 voice assistant", "Python TTS libraries", "pyttsx3 usage", "Convert text-to-speech function"]}'},
+
+    # Example 3: cats / personal memory
+    {"role": "user", "content": "Do you remember my cat Mellow?"},
+    {"role": "assistant", "content": '{"queries": ["User cat name", "Previously mentioned pets", "Feline companion facts"]}'},
+
+    # Example 4: cooking / recipe
+    {"role": "user", "content": "I want to make a chocolate cake from scratch, how should I do it?"},
+    {"role": "assistant", "content": '{"queries": ["Chocolate cake recipes", "Baking instructions", "Ingredients for chocolate cake", "Cooking steps"]}'},
+
+    # Example 5: travel / planning
+    {"role": "user", "content": "Can you suggest a travel itinerary for a week in Japan?"},
+    {"role": "assistant", "content": '{"queries": ["Japan travel itinerary", "Top tourist spots in Japan", "Local customs and culture", "Recommended activities in Japan"]}'},
+]
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt.lower()).strip(" .!?")
 
-    query_convo = [
-        {"role": "system", "content": query_msg},
 
-        # Example 1: insurance
-        {"role": "user", "content": "Write an email to my car insurance company and create a persuasive request for them to lower prices based on my good driving record"},
-        {"role": "assistant", "content": '["User name", "Current auto insurance provider", "Driving record", "Insurance policy details"]'},
+def is_low_information(prompt):
+    """True for greetings, acknowledgements and other prompts too short to benefit from expansion."""
+    words = re.findall(r"[a-z0-9]+", normalize_prompt(prompt).replace("'", ""))
+    return sum(w not in LOW_INFORMATION_WORDS for w in words) < MIN_CONTENT_WORDS
 
-        # Example 2: Python voice assistant
-        {"role": "user", "content": "How can I convert the speak function in my Llama3 Python voice assistant to use pyttsx3 instead?"},
-        {"role": "assistant", "content": '["Llama3 voice assistant", "Python TTS libraries", "pyttsx3 usage", "Convert text-to-speech function"]'},
 
-        # Example 3: cats / personal memory
-        {"role": "user", "content": "Do you remember my cat Mellow?"},
-        {"role": "assistant", "content": '["User cat name", "Previously mentioned pets", "Feline companion facts"]'},
+def _cached(key):
+    with _cache_lock:
+        queries = _cache.get(key)
+        if queries is not None:
+            _cache.move_to_end(key)
+        return queries
 
-        # Example 4: cooking / recipe
-        {"role": "user", "content": "I want to make a chocolate cake from scratch, how should I do it?"},
-        {"role": "assistant", "content": '["Chocolate cake recipes", "Baking instructions", "Ingredients for chocolate cake", "Cooking steps"]'},
 
-        # Example 5: travel / planning
-        {"role": "user", "content": "Can you suggest a travel itinerary for a week in Japan?"},
-        {"role": "assistant", "content": '["Japan travel itinerary", "Top tourist spots in Japan", "Local customs and culture", "Recommended activities in Japan"]'},
+def _remember(key, queries):
+    with _cache_lock:
+        _cache[key] = queries
+        _cache.move_to_end(key)
+        while len(_cache) > QUERY_CACHE_SIZE:
+            _cache.popitem(last=False)
 
-        # Dynamic user prompt
-        {"role": "user", "content": prompt},
-    ]
 
-    response = ollama.chat(model='llama3', messages=query_convo)
+def _record_saved():
+    # Estimate the time saved from the mean latency of real expansions
+    expansion = metrics.summary("query_expansion.llm")
+    if expansion:
+        metrics.incr("query_expansion.seconds_saved", expansion["mean"])
+
+
+def create_queries(prompt):
+    """
+    Expand the prompt into memory search queries.
+    Low-information prompts are searched as-is, repeated prompts are served from
+    an in-process cache, and everything else takes one short llama3 call.
+    """
+    if is_low_information(prompt):
+        metrics.incr("query_expansion.skipped")
+        _record_saved()
+        return [prompt]
+
+    key = normalize_prompt(prompt)
+    queries = _cached(key)
+    if queries is not None:
+        metrics.incr("query_expansion.cache_hit")
+        _record_saved()
+        return list(queries)
+
+    metrics.incr("query_expansion.llm")
+    start = time.perf_counter()
+    queries = expand_queries(prompt)
+    metrics.observe("query_expansion.llm", time.perf_counter() - start)
+    if queries is None:
+        metrics.incr("query_expansion.parse_failed")
+        return [prompt]
+
+    _remember(key, queries)
+    return list(queries)
+
+
+def expand_queries(prompt):
+    """One JSON-mode llama3 call; returns a list of query strings or None if the output is unusable."""
+    response = llm.chat(
+        "query_expansion",
+        QUERY_EXPANSION_PREFIX + [{"role": "user", "content": prompt}],
+        format="json",
+        options={"num_predict": QUERY_NUM_PREDICT},
+    )
     print(Fore.LIGHTYELLOW_EX + f'\nVector database queries: {response["message"]["content"]}')
     try:
-        return ast.literal_eval(response['message']['content'])
-    except Exception:
-        return [prompt]
+        queries = json.loads(response['message']['content']).get("queries")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if not isinstance(queries, list):
+        return None
+    queries = [q for q in queries if isinstance(q, str) and q.strip()]
+    return queries or None
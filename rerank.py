@@ -0,0 +1,116 @@
+import json
+import os
+import llm
+from metrics import metrics
+
+RERANK_MODES = ("similarity", "batch_llm", "per_pair")
+DEFAULT_RERANK_MODE = os.environ.get("VERA_RERANK_MODE", "batch_llm")
+SIMILARITY_THRESHOLD = 0.55  # cosine similarity, embeddings are unit-normalized
+
+
+CLASSIFY_MSG = (
+    "You are an embedding classification AI agent. "
+    "Your input will be a search query and one chunk of embedded text. "
+    "You will NOT respond as an AI assistant. You will only respond with the single word 'yes' or 'no'. "
+    "Determine whether the embedded context directly contains information needed to answer the search query. "
+    "Respond 'yes' only if the context is highly relevant and directly useful to the query. "
+    "If it is not directly relevant, respond 'no'. "
+    "Do not explain your answer and do not output anything other than 'yes' or 'no'."
+)
+
+# Static prefixes, identical on every call so the server can reuse its prompt cache
+CLASSIFY_PREFIX = [
+    {"role": "system", "content": CLASSIFY_MSG},
+
+    # Example 1: directly relevant
+    {"role": "user", "content": "SEARCH QUERY: What is the user's name?\n\nEMBEDDED CONTEXT: You are Hoang. How can I help you today?"},
+    {"role": "assistant", "content": "yes"},
+
+    # Example 2: not relevant
+    {"role": "user", "content": "SEARCH QUERY: Llama3 Python Voice Assistant\n\nEMBEDDED CONTEXT: Siri is a voice assistant developed by Apple Inc."},
+    {"role": "assistant", "content": "no"},
+]
+
+CLASSIFY_BATCH_MSG = (
+    "You are an embedding classification AI agent. "
+    "Your input will be a numbered list of candidates, each a search query and one chunk of embedded text. "
+    "You will NOT respond as an AI assistant. "
+    "For each candidate, determine whether the embedded context directly contains information needed to answer its search query. "
+    "Only count a candidate if the context is highly relevant and directly useful to the query. "
+    'Respond ONLY with a JSON object of the form {"relevant": [candidate numbers]}, using an empty list if none are relevant.'
+)
+
+
+def format_candidates(pairs):
+    return "\n\n".join(
+        f"[{i}] SEARCH QUERY: {query}\nEMBEDDED CONTEXT: {context}"
+        for i, (query, context) in enumerate(pairs)
+    )
+
+
+CLASSIFY_BATCH_PREFIX = [
+    {"role": "system", "content": CLASSIFY_BATCH_MSG},
+
+    # Example: one relevant, one not
+    {"role": "user", "content": format_candidates([
+        ("What is the user's name?", "You are Hoang. How can I help you today?"),
+        ("Llama3 Python Voice Assistant", "Siri is a voice assistant developed by Apple Inc."),
+    ])},
+    {"role": "assistant", "content": '{"relevant": [0]}'},
+]
+
+
+def classify_embedding(query, context):
+    response = llm.chat("rerank.per_pair", CLASSIFY_PREFIX + [
+        # Dynamic query/context
+        {"role": "user", "content": f"SEARCH QUERY: {query}\n\nEMBEDDED CONTEXT: {context}"}
+    ])
+    return response['message']['content'].strip().lower()
+
+
+def classify_embeddings_batch(candidates):
+    """
+    Judge every (query, context) candidate in a single LLM call.
+    Returns the set of candidate indices judged relevant.
+    """
+    response = llm.chat("rerank.batch_llm", CLASSIFY_BATCH_PREFIX + [
+        # Dynamic candidates
+        {"role": "user", "content": format_candidates([(c["query"], c["document"]) for c in candidates])},
+    ], format="json")
+    relevant = json.loads(response['message']['content']).get("relevant", [])
+    return {int(i) for i in relevant if str(i).lstrip("-").isdigit() and 0 <= int(i) < len(candidates)}
+
+
+def rerank(candidates, mode=DEFAULT_RERANK_MODE, threshold=SIMILARITY_THRESHOLD):
+    """
+    Filter retrieved memory candidates down to the relevant ones.
+
+    candidates: list of dicts with "query", "document" and "similarity".
+    mode:
+        "similarity" - keep candidates at or above the cosine threshold, no LLM calls
+        "batch_llm"  - one LLM call judges all candidates together
+        "per_pair"   - one LLM call per candidate (original behaviour)
+    Returns the set of relevant documents.
+    """
+    if mode not in RERANK_MODES:
+        raise ValueError(f"Unknown rerank mode '{mode}', expected one of {RERANK_MODES}")
+    if not candidates:
+        return set()
+
+    with metrics.timer(f"recall.rerank.{mode}"):
+        if mode == "similarity":
+            return {c["document"] for c in candidates if c["similarity"] >= threshold}
+
+        if mode == "batch_llm":
+            try:
+                relevant = classify_embeddings_batch(candidates)
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                # Unparseable judgement: fall back to the vector-similarity filter
+                metrics.incr("recall.rerank.batch_llm.fallback")
+                return {c["document"] for c in candidates if c["similarity"] >= threshold}
+            return {candidates[i]["document"] for i in relevant}
+
+        return {
+            c["document"] for c in candidates
+            if 'yes' in classify_embedding(c["query"], context=c["document"])
+        }
@@ -1,5 +1,5 @@
 -- SQL schema for the application database
--- Creates the `conversations` table used by the app
+-- Creates the `conversations` and `sessions` tables used by the app
 
 CREATE TABLE IF NOT EXISTS conversations (
     id SERIAL PRIMARY KEY,
@@ -7,3 +7,21 @@ CREATE TABLE IF NOT EXISTS conversations (
     response TEXT NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Time-range history loads (id ranges already use the primary key)
+CREATE INDEX IF NOT EXISTS conversations_created_at_idx ON conversations (created_at, id);
+
+-- Full-text search over conversations for lexical memory recall
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', prompt || ' ' || response)) STORED;
+CREATE INDEX IF NOT EXISTS conversations_search_idx ON conversations USING GIN (search_vector);
+
+-- Conversation state of API sessions evicted from memory,
+-- so they can be rehydrated when the client returns
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    convo JSONB NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+-- Sessions idle longer than VERA_SESSION_RETENTION are pruned by the API
+CREATE INDEX IF NOT EXISTS sessions_updated_at_idx ON sessions (updated_at);
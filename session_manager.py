@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from db import asave_session, aload_session, aprune_sessions
+from metrics import metrics
+
+MAX_SESSIONS = int(os.environ.get("VERA_MAX_SESSIONS", 256))
+MAX_SESSION_MEMORY = int(os.environ.get("VERA_MAX_SESSION_MEMORY", 256 * 1024 * 1024))  # bytes of conversation text
+SESSION_TTL = float(os.environ.get("VERA_SESSION_TTL", 3600))  # seconds idle before eviction
+SPILL_SESSIONS = os.environ.get("VERA_SPILL_SESSIONS", "1") == "1"
+SESSION_SWEEP_INTERVAL = float(os.environ.get("VERA_SESSION_SWEEP_INTERVAL", 60))  # seconds between idle sweeps
+SESSION_RETENTION = float(os.environ.get("VERA_SESSION_RETENTION", 30 * 86400))  # seconds spilled sessions are kept, 0 = forever
+
+
+class _Session:
+    __slots__ = ("engine", "lock", "last_used", "in_flight")
+
+    def __init__(self):
+        self.engine = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.in_flight = 0  # requests holding or waiting for the lock
+
+
+def convo_size(convo):
+    return sum(len(m["content"]) for m in convo)
+
+
+class SessionManager:
+    """
+    Bounded, LRU-ordered store of VeraEngine sessions for the API.
+
+    Each session has its own lock, so concurrent requests with the same
+    session_id run one at a time. Sessions are evicted when idle longer
+    than the TTL or when the session count / conversation memory caps are
+    exceeded; with spilling enabled their conversation is saved to the
+    `sessions` table and rehydrated on the next request. Eviction runs after
+    each request and in a periodic sweep, so idle sessions also expire when
+    traffic stops; the sweep also prunes spilled sessions older than retention.
+    """
+
+    def __init__(self, engine_factory, max_sessions=MAX_SESSIONS, max_memory=MAX_SESSION_MEMORY,
+                 ttl=SESSION_TTL, spill=SPILL_SESSIONS, sweep_interval=SESSION_SWEEP_INTERVAL,
+                 retention=SESSION_RETENTION):
+        self.engine_factory = engine_factory
+        self.max_sessions = max_sessions
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self.spill = spill
+        self.sweep_interval = sweep_interval
+        self.retention = retention
+        self._sessions = OrderedDict()
+        self._spilling = {}
+        self._sweeper = None
+
+    @asynccontextmanager
+    async def session(self, session_id):
+        """Yield the session's engine with its lock held."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = _Session()
+        self._sessions.move_to_end(session_id)
+
+        # Counted before waiting: lock.locked() is False while a queued waiter has not resumed yet
+        entry.in_flight += 1
+        try:
+            async with entry.lock:
+                if entry.engine is None:
+                    try:
+                        entry.engine = await self._load(session_id)
+                    except Exception:
+                        if self._sessions.get(session_id) is entry:
+                            del self._sessions[session_id]
+                        raise
+                entry.last_used = time.monotonic()
+                try:
+                    yield entry.engine
+                finally:
+                    entry.last_used = time.monotonic()
+        finally:
+            entry.in_flight -= 1
+            await self._evict()
+
+    def start_sweeper(self):
+        """Start the periodic sweep; call from the running event loop (e.g. app startup)."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Session sweep failed: {e}")
+
+    async def sweep(self):
+        await self._evict()
+        if self.spill and self.retention:
+            pruned = await aprune_sessions(self.retention)
+            if pruned:
+                metrics.incr("sessions.pruned", pruned)
+
+    async def _load(self, session_id):
+        # Engine init syncs the memory index (DB + embeddings), keep it off the event loop
+        engine = await run_in_threadpool(self.engine_factory)
+
+        convo = None
+        if self.spill:
+            if session_id in self._spilling:
+                await self._spilling[session_id]
+            convo = await aload_session(session_id)
+
+        if convo:
+            engine.convo = convo
+            metrics.incr("sessions.rehydrated")
+        else:
+            metrics.incr("sessions.created")
+        return engine
+
+    def _evictable(self):
+        """Loaded sessions with no request running or waiting, least recently used first."""
+        return [
+            (session_id, entry) for session_id, entry in self._sessions.items()
+            if entry.engine is not None and entry.in_flight == 0
+        ]
+
+    async def _evict(self):
+        now = time.monotonic()
+        count = len(self._sessions)
+        memory = sum(convo_size(e.engine.convo) for e in self._sessions.values() if e.engine is not None)
+
+        for session_id, entry in self._evictable():
+            if now - entry.last_used > self.ttl:
+                reason = "ttl"
+            elif count > self.max_sessions:
+                reason = "capacity"
+            elif memory > self.max_memory:
+                reason = "memory"
+            else:
+                continue
+
+            del self._sessions[session_id]
+            count -= 1
+            memory -= convo_size(entry.engine.convo)
+            metrics.incr("sessions.evicted")
+            metrics.incr(f"sessions.evicted.{reason}")
+            if self.spill:
+                self._spilling[session_id] = asyncio.ensure_future(self._spill(session_id, entry.engine.convo))
+
+        metrics.gauge("sessions.active", len(self._sessions))
+        metrics.gauge("sessions.memory_bytes", memory)
+
+    async def _spill(self, session_id, convo):
+        try:
+            await asave_session(session_id, convo)
+            metrics.incr("sessions.spilled")
+        except Exception:
+            metrics.incr("sessions.spill_failed")
+        finally:
+            # A later eviction of the same session may have replaced this spill
+            if self._spilling.get(session_id) is asyncio.current_task():
+                del self._spilling[session_id]
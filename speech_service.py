@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from metrics import metrics
+from text_to_speech_xtts import sample_rate, split_sentences, synthesize
+
+AUDIO_DIR = os.environ.get("VERA_TTS_DIR", "tts_output")
+TTS_CACHE_MB = float(os.environ.get("VERA_TTS_CACHE_MB", 256))  # synthesized audio kept on disk
+API_TTS = os.environ.get("VERA_API_TTS", "1") == "1"             # speak /audio responses
+FILE_CHUNK = 64 * 1024
+
+
+def audio_id(text, voice=None):
+    """Stable id for text spoken in a voice, so repeated phrases map to the same audio."""
+    return hashlib.sha256(f"{voice or ''}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def wav_header(rate, num_samples=None):
+    """16-bit mono PCM WAV header. Without num_samples the sizes are left open for streaming."""
+    data_size = 0xFFFFFFFF - 36 if num_samples is None else num_samples * 2
+    return (
+        b"RIFF" + struct.pack("<I", data_size + 36) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def to_pcm16(audio):
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class SynthesisJob:
+    """Audio for one id while it is being synthesized, one sentence chunk at a time."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.sample_rate = None
+        self.chunks = []  # PCM16 bytes per sentence
+        self.done = False
+        self.changed = asyncio.Event()
+        self.finished = asyncio.Event()
+
+    def notify(self):
+        # Called from the synthesis thread
+        self.loop.call_soon_threadsafe(self.changed.set)
+        if self.done:
+            self.loop.call_soon_threadsafe(self.finished.set)
+
+
+class SpeechService:
+    """
+    Server-side TTS for API responses.
+
+    Audio is stored as 16-bit WAV files in audio_dir, named by a hash of text
+    and voice, so a repeated phrase is served from disk without synthesis. The
+    files are bounded by max_bytes in total; the least recently used ones are
+    deleted first. XTTS runs on a single background thread, sentence by
+    sentence, so a response can be streamed while it is still being synthesized.
+    """
+
+    def __init__(self, audio_dir=AUDIO_DIR, max_bytes=int(TTS_CACHE_MB * 1024 * 1024)):
+        self.audio_dir = audio_dir
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()  # audio id -> size in bytes, least recently used first
+        self._size = 0
+        self._jobs = {}              # audio id -> SynthesisJob in progress
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")  # one XTTS model
+        os.makedirs(audio_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # Files from previous runs stay cached, oldest first
+        entries = []
+        for name in os.listdir(self.audio_dir):
+            if name.endswith(".wav"):
+                stat = os.stat(os.path.join(self.audio_dir, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, cached_id, size in sorted(entries):
+            self._files[cached_id] = size
+            self._size += size
+        self._evict()
+
+    def path(self, audio_id):
+        return os.path.join(self.audio_dir, f"{audio_id}.wav")
+
+    def _touch(self, audio_id):
+        # Caller holds the lock
+        if audio_id not in self._files:
+            return False
+        self._files.move_to_end(audio_id)
+        return True
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._size > self.max_bytes and len(self._files) > 1:
+            evicted, size = self._files.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(evicted))
+            except FileNotFoundError:
+                pass
+            metrics.incr("tts.cache_evicted")
+        metrics.gauge("tts.cache_bytes", self._size)
+
+    def request(self, text, voice=None):
+        """
+        Return the audio id for text, starting synthesis in the background unless
+        the audio is cached or already in progress. Call from the event loop.
+        """
+        requested = audio_id(text, voice)
+        with self._lock:
+            if self._touch(requested) or requested in self._jobs:
+                metrics.incr("tts.cache_hit")
+                return requested
+            job = SynthesisJob(asyncio.get_running_loop())
+            self._jobs[requested] = job
+
+        metrics.incr("tts.cache_miss")
+        self._executor.submit(self._synthesize, requested, text, voice, job)
+        return requested
+
+    def _synthesize(self, requested, text, voice, job):
+        try:
+            start = time.perf_counter()
+            job.sample_rate = sample_rate()
+            for sentence in split_sentences(text):
+                job.chunks.append(to_pcm16(synthesize(sentence, voice)))
+                job.notify()
+
+            data = b"".join(job.chunks)
+            tmp_path = self.path(requested) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(wav_header(job.sample_rate, len(data) // 2))
+                f.write(data)
+            os.replace(tmp_path, self.path(requested))
+            metrics.observe("tts.response_synthesis", time.perf_counter() - start)
+
+            size = os.path.getsize(self.path(requested))
+            with self._lock:
+                self._files[requested] = size
+                self._size += size
+                self._evict()
+        except Exception as e:
+            print(f"⚠️ Speech synthesis failed: {e}")
+        finally:
+            with self._lock:
+                self._jobs.pop(requested, None)
+            job.done = True
+            job.notify()
+
+    async def wait(self, audio_id):
+        """Path of the finished WAV file, waiting for synthesis in progress; None if unknown or failed."""
+        with self._lock:
+            job = self._jobs.get(audio_id)
+        if job:
+            await job.finished.wait()
+        with self._lock:
+            return self.path(audio_id) if self._touch(audio_id) else None
+
+    def open_stream(self, audio_id):
+        """
+        Async iterator over the WAV bytes of audio_id, sent sentence by sentence
+        while synthesis is in progress; None if the id is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(audio_id)
+            f = None
+            if job is None and self._touch(audio_id):
+                # Opened under the lock so eviction can't delete it first; an open file
+                # stays readable even if it is evicted while streaming
+                try:
+                    f = open(self.path(audio_id), "rb")
+                except FileNotFoundError:
+                    pass
+        if job:
+            return self._stream_job(job)
+        if f:
+            return self._stream_file(f)
+        return None
+
+    async def _stream_job(self, job):
+        sent = 0
+        while True:
+            job.changed.clear()
+            while sent < len(job.chunks):
+                if sent == 0:
+                    yield wav_header(job.sample_rate)
+                yield job.chunks[sent]
+                sent += 1
+            if job.done:
+                return
+            await job.changed.wait()
+
+    async def _stream_file(self, f):
+        try:
+            while chunk := await asyncio.to_thread(f.read, FILE_CHUNK):
+                yield chunk
+        finally:
+            f.close()
+
+
+speech_service = SpeechService()
@@ -1,63 +1,33 @@
+import os
 import queue
+import time
 import sounddevice as sd
 import numpy as np
-from faster_whisper import WhisperModel
-import tempfile
-import subprocess
-import os
-
-MODEL_SIZE = "base"  # tiny / base / small / medium
-SAMPLE_RATE = 16000
-CHUNK_DURATION = 5  # seconds per utterance
-
-model = WhisperModel(
-    MODEL_SIZE,
-    device="cpu",          # auto GPU if available
-    compute_type="int8"    # fast on CPU
-)
+from components import LazyComponent
+from metrics import metrics
+from transcription_service import SAMPLE_RATE, decode_audio, load_model
+
+FRAME_DURATION = 0.03      # seconds per capture block / VAD frame
+FRAME_SAMPLES = int(SAMPLE_RATE * FRAME_DURATION)
+END_SILENCE = float(os.environ.get("VERA_VAD_END_SILENCE", 0.6))          # trailing silence that ends an utterance
+PARTIAL_INTERVAL = float(os.environ.get("VERA_PARTIAL_INTERVAL", 1.0))    # seconds between partial transcripts
+MIN_SPEECH = 0.15          # voiced seconds before an utterance starts
+PRE_ROLL = 0.3             # seconds kept from before speech onset
+MAX_UTTERANCE = 30         # seconds, one Whisper window
+SPEECH_RATIO = 3.0         # frame RMS this far above the noise floor counts as speech
+MIN_SPEECH_RMS = 0.005     # ... and never below this absolute level
+
+whisper_model = LazyComponent("whisper_mic", load_model)  # loaded on first transcription
 
 audio_queue = queue.Queue()
 
 def transcribe_webm(audio_bytes: bytes) -> str:
-    # 1️⃣ Create temp webm file
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as src:
-        src.write(audio_bytes)
-        src_path = src.name  # save path
-
-    # 2️⃣ Create temp wav path (file NOT open)
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as dst:
-        dst_path = dst.name
-
-    print("from to", src_path, "->", dst_path)
-    try:
-        # 3️⃣ ffmpeg runs AFTER files are closed
-        subprocess.run(
-            [
-                "ffmpeg", "-y",
-                "-i", src_path,
-                "-ar", "16000",
-                "-ac", "1",
-                dst_path
-            ],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            check=True
-        )
-
-        # 4️⃣ Whisper reads wav
-        segments, info = model.transcribe(dst_path)
-        text = "".join(segment.text for segment in segments)
-        return text
+    audio = decode_audio(audio_bytes)
+    segments, info = whisper_model.get().transcribe(audio)
+    return "".join(segment.text for segment in segments)
 
-    finally:
-        # 5️⃣ Cleanup (VERY IMPORTANT)
-        if os.path.exists(src_path):
-            os.remove(src_path)
-        if os.path.exists(dst_path):
-            os.remove(dst_path)
-
-def audio_callback(indata, frames, time, status):
-    audio_queue.put(indata.copy())
+def audio_callback(indata, frames, time_info, status):
+    audio_queue.put((indata[:, 0].copy(), time.monotonic()))
 
 def clear_audio_queue():
     while not audio_queue.empty():
@@ -66,35 +36,146 @@ def clear_audio_queue():
         except queue.Empty:
             break
 
-def listen():
-    print("🎙 Whisper listening...")
 
-    with sd.InputStream(
-        samplerate=SAMPLE_RATE,
-        channels=1,
-        dtype="float32",
-        callback=audio_callback
-    ):
-        buffer = []
+class RingBuffer:
+    """Preallocated circular float32 buffer addressed by absolute sample index."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.total = 0  # samples written so far
+
+    def write(self, samples):
+        n = len(samples)
+        start = self.total % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.total += n
+
+    def read(self, start):
+        """Samples from absolute index start (clamped to what is still held) up to now."""
+        start = max(start, self.total - self.capacity)
+        n = self.total - start
+        i = start % self.capacity
+        if i + n <= self.capacity:
+            return self.data[i:i + n].copy()
+        return np.concatenate((self.data[i:], self.data[:n - (self.capacity - i)]))
+
+
+class EnergyVAD:
+    """Frame-level voice activity: RMS energy against an adaptive noise floor."""
+
+    def __init__(self):
+        self.noise_floor = MIN_SPEECH_RMS / SPEECH_RATIO
+
+    def is_speech(self, frame):
+        rms = float(np.sqrt(np.mean(frame ** 2)))
+        speech = rms > max(MIN_SPEECH_RMS, self.noise_floor * SPEECH_RATIO)
+        # Track background noise quickly in silence, and slowly during speech
+        # so a lasting rise in noise is eventually absorbed
+        rate = 0.0002 if speech else 0.05
+        self.noise_floor += rate * (rms - self.noise_floor)
+        return speech
+
+
+class MicrophoneListener:
+    """
+    Persistent microphone capture with voice-activity endpointing.
+
+    One InputStream stays open for the life of the listener. Captured frames
+    go into a preallocated ring buffer; an utterance starts after MIN_SPEECH
+    of voiced frames (plus PRE_ROLL of lead-in) and ends after end_silence
+    of silence or MAX_UTTERANCE, instead of at fixed 5 s boundaries.
+    """
+
+    def __init__(self, end_silence=END_SILENCE, partial_interval=PARTIAL_INTERVAL):
+        self.end_silence = end_silence
+        self.partial_interval = partial_interval
+        self.ring = RingBuffer(int((MAX_UTTERANCE + PRE_ROLL) * SAMPLE_RATE))
+        self.vad = EnergyVAD()
+        self.stream = None
+        self.last_latency = None  # seconds from end of speech to the last final transcript
+
+    def start(self):
+        if self.stream is None:
+            self.stream = sd.InputStream(
+                samplerate=SAMPLE_RATE,
+                channels=1,
+                dtype="float32",
+                blocksize=FRAME_SAMPLES,
+                callback=audio_callback
+            )
+            self.stream.start()
+            print("🎙 Whisper listening...")
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _transcribe(self, audio, partial=False):
+        segments, _ = whisper_model.get().transcribe(
+            audio,
+            language="en",
+            beam_size=1 if partial else 5,
+            without_timestamps=True,
+            condition_on_previous_text=False,
+        )
+        return " ".join(seg.text.strip() for seg in segments).strip()
+
+    def utterances(self, on_partial=None):
+        """
+        Yield one transcript per spoken utterance. on_partial(text) is called
+        with the transcript so far every partial_interval while speech continues.
+        """
+        self.start()
+        voiced = silent = 0
+        start = None            # absolute sample index where the current utterance begins
+        floor = self.ring.total  # audio from before this call (e.g. while Vera spoke) is never used
+        last_speech_at = next_partial = None
 
         while True:
-            try:
-                data = audio_queue.get_nowait()  # non-blocking
-            except queue.Empty:
-                continue  # no audio yet, go back to flag check
-            buffer.append(data)
-
-            length = sum(len(b) for b in buffer) / SAMPLE_RATE
-            if length >= CHUNK_DURATION:
-                audio = np.concatenate(buffer, axis=0).flatten()
-                buffer.clear()
-
-                segments, _ = model.transcribe(
-                    audio,
-                    language="en",
-                    vad_filter=True
-                )
-
-                text = " ".join(seg.text.strip() for seg in segments).strip()
+            frame, captured_at = audio_queue.get()  # blocks while idle
+            self.ring.write(frame)
+            speech = self.vad.is_speech(frame)
+
+            if start is None:
+                voiced = voiced + 1 if speech else 0
+                if voiced * FRAME_DURATION >= MIN_SPEECH:
+                    onset = self.ring.total - voiced * FRAME_SAMPLES
+                    start = max(floor, onset - int(PRE_ROLL * SAMPLE_RATE))
+                    silent = 0
+                    last_speech_at = captured_at
+                    next_partial = captured_at + self.partial_interval
+                continue
+
+            if speech:
+                silent = 0
+                last_speech_at = captured_at
+            else:
+                silent += 1
+
+            length = (self.ring.total - start) / SAMPLE_RATE
+            if silent * FRAME_DURATION >= self.end_silence or length >= MAX_UTTERANCE:
+                with metrics.timer("stt.mic_transcribe"):
+                    text = self._transcribe(self.ring.read(start))
+                self.last_latency = time.monotonic() - last_speech_at
+                metrics.observe("stt.speech_end_to_transcript", self.last_latency)
+                start = None
+                voiced = 0
+                if text:
+                    yield text
+                    floor = self.ring.total
+            elif on_partial and captured_at >= next_partial and audio_queue.qsize() * FRAME_DURATION < 0.2:
+                # Only when caught up with capture, so partials never delay endpointing much
+                next_partial = captured_at + self.partial_interval
+                text = self._transcribe(self.ring.read(start), partial=True)
                 if text:
-                    yield text
\ No newline at end of file
+                    on_partial(text)
+
+
+listener = MicrophoneListener()
+
+def listen(on_partial=None):
+    return listener.utterances(on_partial)
@@ -0,0 +1,110 @@
+import json
+import os
+import zlib
+import numpy as np
+import pytest
+
+for module in ("faiss", "datasets", "ollama", "tqdm"):
+    pytest.importorskip(module)
+
+import faiss
+
+import external_rag_module
+from external_rag_module import TwitchChatRAG
+
+DIM = 16
+
+
+def fake_embed_texts(texts, batch_size=None):
+    vectors = np.stack([
+        np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(DIM).astype("float32")
+        for text in texts
+    ])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class FakeDataset(list):
+    def skip(self, n):
+        return FakeDataset(self[n:])
+
+
+class Interrupted(Exception):
+    pass
+
+
+def lines(prefix, n, fail_after=None):
+    for i in range(n):
+        if i == fail_after:
+            raise Interrupted()
+        yield f"{prefix} {i}"
+
+
+@pytest.fixture
+def make_rag(tmp_path, monkeypatch):
+    monkeypatch.setattr(external_rag_module, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(external_rag_module, "embed_text", lambda text: fake_embed_texts([text])[0])
+    dataset = FakeDataset({"Message": f"chat line {i}"} for i in range(200))
+    monkeypatch.setattr(external_rag_module, "load_dataset", lambda *args, **kwargs: dataset)
+
+    def make():
+        return TwitchChatRAG(index_path=str(tmp_path / "index.faiss"), messages_path=str(tmp_path / "messages"),
+                             k=1, max_messages=None, chunk_size=32, checkpoint_every=1)
+    return make
+
+
+def assert_consistent(rag, expected):
+    assert len(rag.messages) == rag.index.ntotal == expected
+    # Vector i must still belong to message i
+    for i in (0, expected - 1):
+        assert rag.retrieve(rag.messages[i]) == [rag.messages[i]]
+
+
+def test_failed_append_is_rolled_back_on_retry(make_rag):
+    rag = make_rag()
+    assert_consistent(rag, 200)
+
+    with pytest.raises(Interrupted):
+        rag.add_messages(lines("stream log", 100, fail_after=70), source="stream")
+    assert rag.add_messages(lines("stream log", 100), source="stream") == 100
+
+    assert_consistent(rag, 300)
+    assert rag.retrieve("stream log 99") == ["stream log 99"]
+
+
+def test_interrupted_append_resumes_after_restart(make_rag):
+    rag = make_rag()
+    with pytest.raises(Interrupted):
+        rag.add_messages(lines("stream log", 100, fail_after=70), source="stream")
+
+    restarted = make_rag()
+    assert_consistent(restarted, 200)
+    with pytest.raises(ValueError):
+        restarted.add_messages(lines("other log", 10), source="other")
+    restarted.add_messages(lines("stream log", 100), source="stream")
+
+    assert_consistent(make_rag(), 300)
+
+
+def test_messages_without_vectors_are_dropped_on_load(make_rag):
+    rag = make_rag()
+    rag.messages.append(["orphan message"])  # e.g. stored by a version without append checkpoints
+
+    assert_consistent(make_rag(), 200)
+
+
+def test_index_saved_before_normalization_is_normalized_on_load(make_rag, tmp_path):
+    rag = make_rag()
+    legacy = faiss.IndexFlatL2(DIM)
+    # Raw /api/embeddings vectors had arbitrary norms
+    vectors = rag.index.reconstruct_n(0, rag.index.ntotal) * np.linspace(0.5, 20, rag.index.ntotal)[:, None]
+    legacy.add(vectors.astype("float32"))
+    faiss.write_index(legacy, str(tmp_path / "index.faiss"))
+    os.remove(tmp_path / "index.faiss.meta.json")
+
+    upgraded = make_rag()
+
+    norms = np.linalg.norm(upgraded.index.reconstruct_n(0, upgraded.index.ntotal), axis=1)
+    assert np.allclose(norms, 1.0, atol=1e-5)
+    assert_consistent(upgraded, 200)
+    with open(tmp_path / "index.faiss.meta.json", encoding="utf-8") as f:
+        assert json.load(f)["embedding_version"] == external_rag_module.EMBEDDING_VERSION
@@ -0,0 +1,38 @@
+import pytest
+
+for module in ("chromadb", "psycopg", "psycopg_pool", "dotenv", "ollama", "tqdm", "colorama"):
+    pytest.importorskip(module)
+
+from vector_store import merge_candidates, strong_lexical_match
+
+
+def candidate(id_, similarity, rank, **extra):
+    return {"id": id_, "query": "q", "document": f"doc {id_}", "similarity": similarity,
+            "rrf": 1 / (60 + rank), **extra}
+
+
+def test_dense_and_lexical_hit_on_same_id_keeps_lexical_coverage():
+    dense = [candidate("7", 0.9, 1)]
+    lexical = [candidate("7", 0.5, 1, lexical=0.8)]
+
+    merged = merge_candidates(dense, lexical)
+
+    assert len(merged) == 1
+    assert merged[0]["similarity"] == 0.9
+    assert merged[0]["lexical"] == 0.8
+    assert merged[0]["rrf"] == pytest.approx(2 / 61)
+    assert strong_lexical_match(merged)
+
+
+def test_lexical_hit_with_better_similarity_keeps_highest_coverage():
+    merged = merge_candidates([candidate("7", 0.4, 1, lexical=0.9)], [candidate("7", 0.6, 2, lexical=0.3)])
+
+    assert merged[0]["similarity"] == 0.6
+    assert merged[0]["lexical"] == 0.9
+
+
+def test_dense_only_candidates_have_no_lexical_key():
+    merged = merge_candidates([candidate("1", 0.9, 1)], [candidate("1", 0.8, 1), candidate("2", 0.7, 2)])
+
+    assert all("lexical" not in c for c in merged)
+    assert not strong_lexical_match(merged)
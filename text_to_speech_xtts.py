@@ -1,42 +1,243 @@
 import os
-import sounddevice as sd
-import soundfile as sf
-from TTS.api import TTS
+import queue
+import re
+import threading
+import time
+import numpy as np
+from components import LazyComponent
+from metrics import metrics
 
 # Config
-OUTPUT_DIR = "tts_output"
-VOICE_SAMPLE = "voices/vera.wav"
+VOICE_DIR = "voices"                                  # every voices/<name>.wav is a named voice
+LATENTS_DIR = os.path.join(VOICE_DIR, "latents")      # cached speaker conditioning per voice
+DEFAULT_VOICE = os.environ.get("VERA_VOICE", "vera")
 LANGUAGE = "en"
+MIN_SENTENCE_CHARS = 20  # shorter sentences are merged with the next one before synthesis
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace, or a line break
+SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+|\n+')
 
-# Load XTTS ONCE at startup
-print("🔊 Loading XTTS v2...")
-tts = TTS(
-    model_name="tts_models/multilingual/multi-dataset/xtts_v2",
-    gpu=False
-)
-print("✅ XTTS ready")
+def load_tts():
+    from TTS.api import TTS  # importing TTS/torch alone takes seconds
 
+    print("🔊 Loading XTTS v2...")
+    model = TTS(
+        model_name="tts_models/multilingual/multi-dataset/xtts_v2",
+        gpu=False
+    )
+    print("✅ XTTS ready")
+    return model
 
-def speak(text: str, filename: str = "response.wav"):
 
-    if not text.strip():
-        return None
+# Loaded once, on first synthesis
+tts = LazyComponent("xtts", load_tts)
+
+
+def sample_rate():
+    return tts.get().synthesizer.output_sample_rate
+
+
+_voices = {}  # voice name -> (gpt_cond_latent, speaker_embedding)
+_voices_lock = threading.Lock()
+
+
+def voice_sample(name):
+    return os.path.join(VOICE_DIR, f"{name}.wav")
+
+
+def list_voices():
+    return sorted(name[:-4] for name in os.listdir(VOICE_DIR) if name.endswith(".wav"))
+
+
+def compute_latents(sample_path):
+    """Speaker conditioning from a reference clip, with the same settings XTTS uses for speaker_wav."""
+    model = tts.get().synthesizer.tts_model
+    config = model.config
+    return model.get_conditioning_latents(
+        audio_path=[sample_path],
+        gpt_cond_len=config.gpt_cond_len,
+        gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+        max_ref_length=config.max_ref_len,
+        sound_norm_refs=config.sound_norm_refs,
+    )
+
+
+def load_voice(name):
+    """
+    Conditioning latents for a named voice, loaded on first use: from memory,
+    from LATENTS_DIR, or computed once from voices/<name>.wav and saved there.
+    Saved latents are recomputed when the reference clip changes.
+    """
+    import torch
+
+    with _voices_lock:
+        if name in _voices:
+            return _voices[name]
+
+        sample = voice_sample(name)
+        if not os.path.isfile(sample):
+            raise ValueError(f"Unknown voice: {name}")
+        stat = os.stat(sample)
+        source = {"size": stat.st_size, "mtime": stat.st_mtime}
+        path = os.path.join(LATENTS_DIR, f"{name}.pt")
+
+        latents = None
+        if os.path.exists(path):
+            saved = torch.load(path, weights_only=True)
+            if saved["source"] == source:
+                latents = (saved["gpt_cond_latent"], saved["speaker_embedding"])
+
+        if latents is None:
+            with metrics.timer("tts.voice_conditioning"):
+                latents = compute_latents(sample)
+            os.makedirs(LATENTS_DIR, exist_ok=True)
+            torch.save(
+                {"source": source, "gpt_cond_latent": latents[0], "speaker_embedding": latents[1]},
+                path + ".tmp",
+            )
+            os.replace(path + ".tmp", path)
+            print(f"🎙 Cached conditioning latents for voice '{name}'")
+
+        _voices[name] = latents
+        return latents
+
 
-    output_path = os.path.join(OUTPUT_DIR, filename)
+def synthesize(text: str, voice: str | None = None, split_text: bool = False) -> np.ndarray:
+    """Synthesize text to a float32 waveform in memory, reusing the voice's cached conditioning."""
+    gpt_cond_latent, speaker_embedding = load_voice(voice or DEFAULT_VOICE)
+    model = tts.get().synthesizer.tts_model
+    config = model.config
 
-    # Generate speech
-    tts.tts_to_file(
-        text=text,
-        file_path=output_path,
-        speaker_wav=VOICE_SAMPLE,
-        language=LANGUAGE
+    start = time.perf_counter()
+    output = model.inference(
+        text,
+        LANGUAGE,
+        gpt_cond_latent,
+        speaker_embedding,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        enable_text_splitting=split_text,
     )
+    audio = np.asarray(output["wav"], dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    metrics.observe("tts.synthesis", elapsed)
+    if len(audio):
+        metrics.observe("tts.real_time_factor", elapsed / (len(audio) / sample_rate()))
+    return audio
 
-    # Play audio
-    audio, sr = sf.read(output_path)
-    sd.play(audio, sr)
+
+def speak(text: str):
+    import sounddevice as sd  # playback only; the API server may have no audio device
+
+    if not text.strip():
+        return None
+
+    audio = synthesize(text, split_text=True)  # whole responses are split by XTTS itself
+    sd.play(audio, sample_rate())
     sd.wait()  # Wait until playback finishes
+    return audio
+
+
+class SentenceSplitter:
+    """Cut streamed text into sentences as soon as each one is complete."""
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            sentence = self.buffer[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+def split_sentences(text):
+    splitter = SentenceSplitter()
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechStream:
+    """
+    Speak a response while the LLM is still streaming it.
+
+    Tokens are split into sentences; a worker thread synthesizes each sentence
+    into an in-memory buffer and a playback thread plays the buffers back to
+    back on one output stream, so speech starts after the first sentence.
+    With play=False the buffers are only collected in `buffers`.
+    """
+
+    def __init__(self, play=True):
+        self.play = play
+        self.splitter = SentenceSplitter()
+        self.buffers = []
+        self.started_at = time.perf_counter()
+        self.time_to_first_audio = None
+        self._sentences = queue.Queue()
+        self._audio = queue.Queue()
+        self._synth_thread = threading.Thread(target=self._synthesize_loop, name="tts-synth", daemon=True)
+        self._play_thread = threading.Thread(target=self._play_loop, name="tts-play", daemon=True)
+        self._synth_thread.start()
+        self._play_thread.start()
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(text):
+            self._sentences.put(sentence)
+
+    def finish(self, wait=True):
+        """Speak whatever is left; with wait=True, block until playback has finished."""
+        for sentence in self.splitter.flush():
+            self._sentences.put(sentence)
+        self._sentences.put(None)
+        if wait:
+            self._play_thread.join()
+
+    def _synthesize_loop(self):
+        try:
+            while True:
+                sentence = self._sentences.get()
+                if sentence is None:
+                    break
+                self._audio.put(synthesize(sentence))
+        except Exception as e:
+            print(f"⚠️ Speech synthesis failed: {e}")
+        finally:
+            self._audio.put(None)
+
+    def _first_audio(self):
+        if self.time_to_first_audio is None:
+            self.time_to_first_audio = time.perf_counter() - self.started_at
+            metrics.observe("tts.time_to_first_audio", self.time_to_first_audio)
+
+    def _play_loop(self):
+        if not self.play:
+            while True:
+                audio = self._audio.get()
+                if audio is None:
+                    return
+                self._first_audio()
+                self.buffers.append(audio)
 
-    return output_path
\ No newline at end of file
+        import sounddevice as sd
+        with sd.OutputStream(samplerate=sample_rate(), channels=1, dtype="float32") as stream:
+            while True:
+                audio = self._audio.get()
+                if audio is None:
+                    break
+                self._first_audio()
+                self.buffers.append(audio)
+                stream.write(audio.reshape(-1, 1))  # blocks while the device plays
@@ -0,0 +1,289 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import subprocess
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio as whisper_decode_audio
+from starlette.concurrency import run_in_threadpool
+from components import LazyComponent
+from metrics import metrics
+
+MODEL_SIZE = "base"  # tiny / base / small / medium
+SAMPLE_RATE = 16000
+AUDIO_DECODER = os.environ.get("VERA_AUDIO_DECODER", "pyav")  # pyav / ffmpeg
+
+STT_WORKERS = int(os.environ.get("VERA_STT_WORKERS", 2))             # worker processes, one model each
+STT_QUEUE_SIZE = int(os.environ.get("VERA_STT_QUEUE_SIZE", 16))      # waiting uploads before 429s
+STT_BATCH_SIZE = int(os.environ.get("VERA_STT_BATCH_SIZE", 8))       # short clips decoded together
+STT_BATCH_DELAY = float(os.environ.get("VERA_STT_BATCH_DELAY", 0.02))  # seconds to wait for a fuller batch
+SHORT_CLIP_SECONDS = 30  # one Whisper window: clips up to this long can share a batch
+
+# Decoding options of every transcription, batched or not, so a transcript doesn't depend on load
+TRANSCRIBE_OPTIONS = dict(
+    beam_size=5,
+    compression_ratio_threshold=2.4,  # above: repetitive output, decode again at a higher temperature
+    log_prob_threshold=-1.0,          # below: low confidence, decode again at a higher temperature
+    no_speech_threshold=0.6,          # above (and low confidence): silence
+    vad_filter=False,
+)
+
+
+def load_model(cpu_threads=0):
+    return WhisperModel(
+        MODEL_SIZE,
+        device="cpu",          # auto GPU if available
+        compute_type="int8",   # fast on CPU
+        cpu_threads=cpu_threads,
+    )
+
+
+def decode_audio(audio_bytes: bytes, decoder=None) -> np.ndarray:
+    """
+    Decode an uploaded clip (webm/ogg/wav/...) to 16 kHz mono float32 samples
+    without touching the disk.
+    "pyav": in-process via the PyAV decoder bundled with faster-whisper.
+    "ffmpeg": ffmpeg reading stdin and writing raw float32 to stdout.
+    """
+    if (decoder or AUDIO_DECODER) == "ffmpeg":
+        result = subprocess.run(
+            [
+                "ffmpeg", "-loglevel", "error",
+                "-i", "pipe:0",
+                "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "pipe:1",
+            ],
+            input=audio_bytes,
+            capture_output=True,
+            check=True,
+        )
+        return np.frombuffer(result.stdout, dtype=np.float32)
+
+    return whisper_decode_audio(io.BytesIO(audio_bytes), sampling_rate=SAMPLE_RATE)
+
+
+# ---- Worker process side ----
+
+_worker_model = None
+
+
+def _init_worker(cpu_threads):
+    global _worker_model
+    _worker_model = load_model(cpu_threads)
+
+
+def _worker_ready():
+    # Runs after the worker's initializer has loaded its model
+    return _worker_model is not None
+
+
+def _is_short(audio):
+    return len(audio) <= SHORT_CLIP_SECONDS * SAMPLE_RATE
+
+
+def _transcribe_one(model, audio):
+    # Short clips are decoded without timestamps, as in a batch
+    segments, _ = model.transcribe(audio, without_timestamps=_is_short(audio), **TRANSCRIBE_OPTIONS)
+    return "".join(segment.text for segment in segments)
+
+
+def _compression_ratio(text):
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data))
+
+
+def _transcribe_short_batch(model, audios):
+    """
+    Transcribe clips of at most one Whisper window in a single batched
+    encoder/decoder pass: beam search at temperature 0, no timestamps,
+    per-clip language detection, the same as _transcribe_one's first attempt.
+    Clips whose result model.transcribe would reject (and decode again at a
+    higher temperature) are None, so the caller transcribes them one by one.
+    """
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+    from faster_whisper.transcribe import get_ctranslate2_storage
+
+    n_frames = model.feature_extractor.nb_max_frames
+    features = np.stack([pad_or_trim(model.feature_extractor(audio)[:, :n_frames], n_frames) for audio in audios])
+    encoder_output = model.model.encode(get_ctranslate2_storage(features))
+
+    if model.model.is_multilingual:
+        # Tokens look like "<|en|>"
+        languages = [results[0][0][2:-2] for results in model.model.detect_language(encoder_output)]
+    else:
+        languages = ["en"] * len(audios)
+    tokenizers = [
+        Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+        for language in languages
+    ]
+
+    results = model.model.generate(
+        encoder_output,
+        [list(tokenizer.sot_sequence) + [tokenizer.no_timestamps] for tokenizer in tokenizers],
+        beam_size=TRANSCRIBE_OPTIONS["beam_size"],
+        patience=1,
+        length_penalty=1,
+        max_length=model.max_length,
+        suppress_blank=True,
+        suppress_tokens=[-1],
+        return_scores=True,
+        return_no_speech_prob=True,
+    )
+
+    texts = []
+    for tokenizer, result in zip(tokenizers, results):
+        tokens = result.sequences_ids[0]
+        text = tokenizer.decode(tokens).strip()
+        # Same acceptance rules as faster-whisper's temperature fallback
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        low_confidence = avg_logprob < TRANSCRIBE_OPTIONS["log_prob_threshold"]
+        if result.no_speech_prob > TRANSCRIBE_OPTIONS["no_speech_threshold"] and low_confidence:
+            texts.append("")
+        elif low_confidence or _compression_ratio(text) > TRANSCRIBE_OPTIONS["compression_ratio_threshold"]:
+            texts.append(None)
+        else:
+            texts.append(text)
+    return texts
+
+
+def _transcribe_batch(audios):
+    """Runs in a worker process. Returns (transcripts, inference seconds)."""
+    start = time.perf_counter()
+    texts = [None] * len(audios)
+
+    short = [i for i, audio in enumerate(audios) if _is_short(audio)]
+    if len(short) > 1 and not TRANSCRIBE_OPTIONS["vad_filter"]:
+        for i, text in zip(short, _transcribe_short_batch(_worker_model, [audios[i] for i in short])):
+            texts[i] = text
+
+    for i, audio in enumerate(audios):
+        if texts[i] is None:
+            texts[i] = _transcribe_one(_worker_model, audio)
+
+    return texts, time.perf_counter() - start
+
+
+# ---- API process side ----
+
+class TranscriptionQueueFull(Exception):
+    """Raised when the transcription queue is at capacity; the API answers 429."""
+
+
+class TranscriptionService:
+    """
+    Whisper transcription on a pool of worker processes, each with its own
+    int8 model. Uploads are decoded in a thread, then wait in a bounded queue;
+    one dispatcher per worker takes whatever arrived within batch_delay (up to
+    batch_size clips) and sends it to the pool as one batch, so at most one
+    batch per worker is in flight. When the queue is full, transcribe raises
+    TranscriptionQueueFull instead of piling up work.
+    """
+
+    def __init__(self, workers=STT_WORKERS, queue_size=STT_QUEUE_SIZE,
+                 batch_size=STT_BATCH_SIZE, batch_delay=STT_BATCH_DELAY, cpu_threads=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        # Split the cores between workers instead of every model using all of them
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+        self._pool = None
+        self.worker_pool = LazyComponent("whisper", self.start_workers)  # started on first use or by prewarm
+        self._queue = None
+        self._dispatchers = []
+
+    def start_workers(self):
+        """Start the worker pool and wait for the workers to load their models."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),  # don't fork the API process's threads
+                initializer=_init_worker,
+                initargs=(self.cpu_threads,),
+            )
+        # One task per worker: each submit starts another process, and the models load in parallel
+        for future in [self._pool.submit(_worker_ready) for _ in range(self.workers)]:
+            future.result()
+        return self._pool
+
+    def _restart_workers(self, pool):
+        """Replace a pool whose worker died (e.g. killed for memory); the batches it held fail."""
+        if self._pool is not pool:
+            return  # another dispatcher already replaced it
+        print("⚠️ A Whisper worker died, restarting the worker pool")
+        metrics.incr("stt.pool_restarted")
+        self._pool = None
+        self.worker_pool.reset()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.worker_pool.prewarm()
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), max(0.0, deadline - time.monotonic())))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            metrics.gauge("stt.queue_depth", self._queue.qsize())
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                metrics.observe("stt.queue_wait", now - enqueued_at)
+            metrics.observe("stt.batch_size", len(batch))
+
+            pool = None
+            try:
+                pool = self.worker_pool.get() if self.worker_pool.ready else await run_in_threadpool(self.worker_pool.get)
+                texts, seconds = await loop.run_in_executor(pool, _transcribe_batch, [a for a, _, _ in batch])
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._restart_workers(pool)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            metrics.observe("stt.inference", seconds)
+            audio_seconds = sum(len(audio) for audio, _, _ in batch) / SAMPLE_RATE
+            if audio_seconds:
+                metrics.observe("stt.real_time_factor", seconds / audio_seconds)
+            for (_, future, _), text in zip(batch, texts):
+                if not future.done():
+                    future.set_result(text)
+
+    async def transcribe(self, audio_bytes: bytes) -> str:
+        if not self.worker_pool.ready:
+            await run_in_threadpool(self.worker_pool.get)
+        self._ensure_started()
+        if self._queue.full():
+            metrics.incr("stt.rejected")
+            raise TranscriptionQueueFull()
+
+        audio = await run_in_threadpool(decode_audio, audio_bytes)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((audio, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            metrics.incr("stt.rejected")
+            raise TranscriptionQueueFull()
+        return await future
+
+
+transcription_service = TranscriptionService()
@@ -1,76 +1,215 @@
+import os
+import threading
 import chromadb
-import ollama
-from tqdm import tqdm
-
-client = chromadb.Client()
-
-
-def create_vector_store(conversations):
-    vector_store_name = "vera_conversations"
-    try:
-        client.delete_collection(name=vector_store_name)
-    except ValueError:
-        pass
-
-    vector_store = client.create_collection(name=vector_store_name)
-    for c in conversations:
-        serialized_convo = f'prompt: {c["prompt"]} response: {c["response"]}'
-        response = ollama.embeddings(model="nomic-embed-text", prompt=serialized_convo)
-        embedding = response['embedding']
-        vector_store.add(
-            ids=[str(c["id"])],
-            documents=[serialized_convo],
-            embeddings=[embedding],
-        )
-
-
-def classify_embedding(query, context):
-    classify_msg = (
-        "You are an embedding classification AI agent. "
-        "Your input will be a search query and one chunk of embedded text. "
-        "You will NOT respond as an AI assistant. You will only respond with the single word 'yes' or 'no'. "
-        "Determine whether the embedded context directly contains information needed to answer the search query. "
-        "Respond 'yes' only if the context is highly relevant and directly useful to the query. "
-        "If it is not directly relevant, respond 'no'. "
-        "Do not explain your answer and do not output anything other than 'yes' or 'no'."
+import numpy as np
+from colorama import Fore
+from db import iter_conversations, search_conversations
+from embeddings import EMBEDDING_VERSION, embed_text, embed_texts, iter_embedded_chunks
+from metrics import metrics
+from rerank import rerank, DEFAULT_RERANK_MODE
+
+MEMORY_PATH = "data/memory/chroma"
+VECTOR_STORE_NAME = "vera_conversations"
+HIGH_WATER_MARK_KEY = "last_conversation_id"
+EMBEDDING_VERSION_KEY = "embedding_version"
+RRF_K = 60  # reciprocal-rank fusion constant
+
+RETRIEVAL_MODES = ("dense", "hybrid", "lexical_first")
+DEFAULT_RETRIEVAL_MODE = os.environ.get("VERA_RETRIEVAL_MODE", "hybrid")
+LEXICAL_STRONG_COVERAGE = 0.6  # share of prompt terms a lexical hit must contain to skip query expansion
+
+# Persistent, process-wide memory index shared by every session
+client = chromadb.PersistentClient(path=MEMORY_PATH)
+_sync_lock = threading.Lock()
+
+
+def get_vector_store():
+    return client.get_or_create_collection(name=VECTOR_STORE_NAME)
+
+
+def serialize_conversation(prompt, response):
+    return f'prompt: {prompt} response: {response}'
+
+
+def index_conversation(conversation_id, prompt, response):
+    """
+    Append a single conversation turn to the memory index.
+    Called right after the turn is written to the database.
+    """
+    serialized_convo = serialize_conversation(prompt, response)
+    get_vector_store().upsert(
+        ids=[str(conversation_id)],
+        documents=[serialized_convo],
+        embeddings=[embed_text(serialized_convo).tolist()],
     )
 
-    classify_convo = [
-        {"role": "system", "content": classify_msg},
-
-        # Example 1: directly relevant
-        {"role": "user", "content": "SEARCH QUERY: What is the user's name?\n\nEMBEDDED CONTEXT: You are Hoang. How can I help you today?"},
-        {"role": "assistant", "content": "yes"},
-
-        # Example 2: not relevant
-        {"role": "user", "content": "SEARCH QUERY: Llama3 Python Voice Assistant\n\nEMBEDDED CONTEXT: Siri is a voice assistant developed by Apple Inc."},
-        {"role": "assistant", "content": "no"},
 
-        # Dynamic query/context
-        {"role": "user", "content": f"SEARCH QUERY: {query}\n\nEMBEDDED CONTEXT: {context}"}
-    ]
-    
-    response = ollama.chat(model='llama3', messages=classify_convo)
-    return response['message']['content'].strip().lower()
-
-
-def retrieve_embedding(queries, results_per_query=2):
-    embeddings = set()
-
-    for query in tqdm(queries, desc="Processing queries to vector store"):
-        response = ollama.embeddings(model="nomic-embed-text", prompt=query)
-        query_embedding = response['embedding']
-
-        vector_store = client.get_collection(name="vera_conversations")
+def unindex_conversation(conversation_id):
+    if conversation_id is not None:
+        get_vector_store().delete(ids=[str(conversation_id)])
+
+
+def check_embedding_version(vector_store):
+    """
+    Re-embed the memory index from scratch if it was built with another
+    embedding version (unnormalized vectors give different distances).
+    Returns the collection to use.
+    """
+    metadata = vector_store.metadata or {}
+    if metadata.get(EMBEDDING_VERSION_KEY) == EMBEDDING_VERSION:
+        return vector_store
+
+    if vector_store.count():
+        print(f"⚠️ Memory index has embedding version {metadata.get(EMBEDDING_VERSION_KEY, 1)}, "
+              f"re-embedding every conversation for version {EMBEDDING_VERSION}")
+        metrics.incr("recall.memory_reembedded")
+        client.delete_collection(VECTOR_STORE_NAME)
+        vector_store = get_vector_store()
+        metadata = {}
+    vector_store.modify(metadata={**metadata, EMBEDDING_VERSION_KEY: EMBEDDING_VERSION})
+    return vector_store
+
+
+def sync_vector_store():
+    """
+    Bring the memory index up to date with the conversations table, after
+    re-embedding it if it predates the current embedding version.
+    Only rows newer than the stored high-water mark are fetched, and rows
+    already indexed (e.g. by index_conversation) are not embedded again.
+    Returns the number of newly embedded conversations.
+    """
+    with _sync_lock:
+        vector_store = check_embedding_version(get_vector_store())
+        last_id = (vector_store.metadata or {}).get(HIGH_WATER_MARK_KEY, 0)
+        embedded = 0
+
+        # Page through history so progress is kept even if indexing is interrupted
+        for conversations in iter_conversations(after_id=last_id):
+            indexed = set(vector_store.get(ids=[str(c["id"]) for c in conversations], include=[])["ids"])
+            pending = [c for c in conversations if str(c["id"]) not in indexed]
+
+            documents = [serialize_conversation(c["prompt"], c["response"]) for c in pending]
+            for offset, chunk, vectors in iter_embedded_chunks(documents, desc="Indexing new conversations"):
+                vector_store.add(
+                    ids=[str(c["id"]) for c in pending[offset:offset + len(chunk)]],
+                    documents=chunk,
+                    embeddings=vectors.tolist(),
+                )
+
+            last_id = conversations[-1]["id"]
+            # modify() replaces the whole metadata dict: keep the embedding version
+            vector_store.modify(metadata={**vector_store.metadata, HIGH_WATER_MARK_KEY: last_id})
+            embedded += len(pending)
+
+        print(Fore.BLUE + f'Indexed {embedded} new conversations (high-water mark: {last_id}).')
+        return embedded
+
+
+def search_memory(queries, results_per_query=2, lexical=False):
+    """
+    Embed the queries together and search the memory index in one batched query.
+    With lexical=True, full-text matches from the conversations table are fused in;
+    if full-text search fails, the vector results are returned on their own.
+    Returns candidate dicts with "id", "query", "document", "similarity" and
+    "rrf" (plus "lexical" coverage for full-text hits), deduplicated by
+    conversation id and ordered by fused rank.
+    """
+    with metrics.timer("recall.embed_queries"):
+        query_embeddings = embed_texts(queries)
+
+    vector_store = get_vector_store()
+    with metrics.timer("recall.vector_search"):
         results = vector_store.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings.tolist(),
             n_results=results_per_query,
         )
-        best_embeddings = results['documents'][0]
-
-        for best in best_embeddings:
-            if best not in embeddings:
-                if 'yes' in classify_embedding(query, context=best):
-                    embeddings.add(best)
 
-    return embeddings
+    ranked_lists = []
+    for query, ids, documents, distances in zip(queries, results['ids'], results['documents'], results['distances']):
+        ranked_lists.append([
+            {
+                "id": id_,
+                "query": query,
+                "document": document,
+                # Squared L2 between unit vectors: cos = 1 - d / 2
+                "similarity": 1 - distance / 2,
+                "rrf": 1 / (RRF_K + rank),
+            }
+            for rank, (id_, document, distance) in enumerate(zip(ids, documents, distances), start=1)
+        ])
+
+    if lexical:
+        try:
+            ranked_lists += lexical_search(vector_store, queries, query_embeddings, results_per_query)
+        except Exception as e:
+            # e.g. schema.sql not re-run yet, so there is no search_vector column: recall stays dense
+            metrics.incr("recall.lexical_failed")
+            print(f"⚠️ Full-text search failed, using vector results only: {e}")
+
+    return merge_candidates(*ranked_lists)
+
+
+def lexical_search(vector_store, queries, query_embeddings, limit):
+    """
+    Full-text search for each query, as one ranked candidate list per query.
+    Similarity is computed from the stored embedding so lexical hits can be
+    filtered like dense ones.
+    """
+    with metrics.timer("recall.lexical_search"):
+        hits = search_conversations(queries, limit=limit)
+
+    ids = list({str(row["id"]) for rows in hits for row in rows})
+    stored = vector_store.get(ids=ids, include=["embeddings"]) if ids else {"ids": [], "embeddings": []}
+    vectors = dict(zip(stored["ids"], stored["embeddings"]))
+
+    ranked_lists = []
+    for query, query_embedding, rows in zip(queries, query_embeddings, hits):
+        ranked = []
+        for rank, row in enumerate(rows, start=1):
+            vector = vectors.get(str(row["id"]))
+            ranked.append({
+                "id": str(row["id"]),
+                "query": query,
+                "document": serialize_conversation(row["prompt"], row["response"]),
+                # Not indexed yet (e.g. a turn still being embedded): no similarity
+                "similarity": float(np.dot(query_embedding, vector)) if vector is not None else 0.0,
+                "rrf": 1 / (RRF_K + rank),
+                "lexical": row["coverage"],
+            })
+        ranked_lists.append(ranked)
+    return ranked_lists
+
+
+def strong_lexical_match(candidates):
+    """True if a full-text hit covers most of the query terms, so query expansion can be skipped."""
+    return any(c.get("lexical", 0) >= LEXICAL_STRONG_COVERAGE for c in candidates)
+
+
+def merge_candidates(*candidate_lists):
+    """
+    Fuse ranked candidate lists with reciprocal-rank fusion: candidates are
+    deduplicated by id, their "rrf" scores summed, the best similarity kept and
+    the highest "lexical" coverage carried over from any full-text hit.
+    """
+    merged = {}
+    for candidates in candidate_lists:
+        for c in candidates:
+            best = merged.get(c["id"])
+            if best is None:
+                merged[c["id"]] = dict(c)
+                continue
+            rrf = best["rrf"] + c["rrf"]
+            lexical = max(best.get("lexical", 0), c.get("lexical", 0))
+            if c["similarity"] > best["similarity"]:
+                best.update(c)
+            best["rrf"] = rrf
+            if lexical:
+                # Full-text coverage survives whichever hit had the better similarity
+                best["lexical"] = lexical
+    return sorted(merged.values(), key=lambda c: c["rrf"], reverse=True)
+
+
+def retrieve_embedding(queries, results_per_query=2, rerank_mode=DEFAULT_RERANK_MODE,
+                       retrieval_mode=DEFAULT_RETRIEVAL_MODE):
+    candidates = search_memory(queries, results_per_query, lexical=retrieval_mode != "dense")
+    return rerank(candidates, mode=rerank_mode)
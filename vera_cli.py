@@ -1,11 +1,11 @@
-import ollama
+import llm
 from colorama import Fore
-from db import fetch_conversations, store_conversation, remove_last_conversation
-from speech_to_text_whisper import listen, clear_audio_queue
-from text_to_speech_xtts import speak
-from vector_store import create_vector_store, retrieve_embedding
+from db import store_conversation, remove_last_conversation
+from speech_to_text_whisper import listen, listener, clear_audio_queue, whisper_model
+from text_to_speech_xtts import SpeechStream, tts
+from vector_store import sync_vector_store, index_conversation, unindex_conversation, retrieve_embedding
 from query_builder import create_queries
-from external_rag_module import TwitchChatRAG
+from external_rag_module import twitch_rag, retrieve_twitch
 
 
 system_prompt = (
@@ -23,35 +23,37 @@ user_voice_enabled = True
 temp_context = []
 convo = [{"role": "system", "content": system_prompt}]
 
-twitch_rag = TwitchChatRAG(
-    k=5,
-    max_messages=10000
-)
-
 def stream_response(prompt):
     response = ''
 
     full_context = convo + temp_context + [{"role": "user", "content": prompt}]
-    stream = ollama.chat("llama3", messages=full_context, stream=True)
     print(Fore.GREEN + "Vera: ")
 
-    for chunk in stream:
+    # Speak sentence by sentence while the response is still streaming
+    speech = SpeechStream() if agent_voice_enabled else None
+
+    for chunk in llm.stream_chat("answer", full_context):
         content = chunk['message']['content']
         response += content
         print(content, end='', flush=True)
+        if speech:
+            speech.feed(content)
     print("\n")
 
     # Reset temp_context
     temp_context.clear()
 
     # Store conversation 
-    store_conversation(prompt=prompt, response=response)
+    conversation_id = store_conversation(prompt=prompt, response=response)
+    index_conversation(conversation_id, prompt=prompt, response=response)
     convo.append({"role": "user", "content": prompt})
     convo.append({"role": "assistant", "content": response})
 
-    # Speak
-    if agent_voice_enabled and response.strip():
-        speak(response, filename="response.wav")
+    # Finish speaking before listening again
+    if speech:
+        speech.finish()
+        if speech.time_to_first_audio is not None:
+            print(Fore.LIGHTBLACK_EX + f"🔊 First audio after {speech.time_to_first_audio:.2f}s\n")
 
 
 def recall(prompt):
@@ -66,7 +68,7 @@ def recall(prompt):
         })
 
     # Twitch Chat RAG
-    twitch_context = twitch_rag.retrieve(prompt)
+    twitch_context = retrieve_twitch(prompt)
     if twitch_context:
         temp_context.append({
             "role": "system",
@@ -79,7 +81,7 @@ def handle_prompt(prompt: str):
     low = prompt.lower()
 
     if low.startswith('/forget'):
-        remove_last_conversation()
+        unindex_conversation(remove_last_conversation())
         if len(convo) >= 2:
             convo.pop()
             convo.pop()
@@ -93,17 +95,29 @@ def handle_prompt(prompt: str):
     stream_response(prompt)
 
 
+def show_partial(text):
+    print(Fore.LIGHTBLACK_EX + f"\r… {text}", end="", flush=True)
+
+
 def main():
-    conversations = fetch_conversations()
     try:
-        create_vector_store(conversations=conversations)
+        sync_vector_store()
     except Exception:
         pass
 
+    # Heavy components load in the background while the prompt is already available
+    twitch_rag.prewarm()
+    if agent_voice_enabled:
+        tts.prewarm()
+
     global user_voice_enabled
+    voice = None
     try:
         if user_voice_enabled:
-            next(listen())
+            whisper_model.prewarm()
+            # One capture stream for the whole session
+            listener.start()
+            voice = listen(on_partial=show_partial)
             print("🎤 Voice input enabled")
     except Exception as e:
         print(f"⚠️ Voice input unavailable, falling back to text: {e}")
@@ -112,9 +126,9 @@ def main():
     while True:
         try:
             if user_voice_enabled:
-                clear_audio_queue()
-                prompt = next(listen()) # Resume the listen() function until it yields the next recognized utterance, then pause it again.
-                print(Fore.CYAN + f"\nYou (voice): {prompt}")
+                clear_audio_queue()  # drop audio captured while Vera was responding
+                prompt = next(voice) # Resume listening until the next utterance is endpointed
+                print(Fore.CYAN + f"\rYou (voice): {prompt}" + Fore.LIGHTBLACK_EX + f"  ({listener.last_latency:.2f}s after speech)")
             else:
                 prompt = input(Fore.CYAN + "You: ").strip()
 
@@ -130,6 +144,8 @@ def main():
         except SystemExit:
             break
 
+    listener.stop()
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,9 +1,23 @@
 # vera_core.py
-import ollama
-from db import fetch_conversations, store_conversation, remove_last_conversation
-from vector_store import create_vector_store, retrieve_embedding
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import llm
+from db import store_conversation, remove_last_conversation, astore_conversation, aremove_last_conversation
+from vector_store import (
+    sync_vector_store, index_conversation, unindex_conversation, search_memory, merge_candidates,
+    strong_lexical_match, DEFAULT_RETRIEVAL_MODE, RETRIEVAL_MODES,
+)
 from query_builder import create_queries
-from external_rag_module import TwitchChatRAG
+from external_rag_module import retrieve_twitch
+from rerank import rerank, DEFAULT_RERANK_MODE, RERANK_MODES
+from metrics import metrics
+from context_window import (
+    CONTEXT_TOKEN_BUDGET, HISTORY_TOKEN_BUDGET, SUMMARY_PREFIX,
+    count_message_tokens, fit_recent_turns, is_summary, summarize_turns,
+)
 
 system_prompt = (
     "You are Vera, an AI assistant with memory of past conversations with this user. "
@@ -14,65 +28,282 @@ system_prompt = (
     "Respond naturally, clearly, and helpfully, using any relevant past information only when it is truly useful."
 )
 
-twitch_rag = TwitchChatRAG(k=5, max_messages=10000)
+# Per-turn budget for recall; whatever context is ready by then is used
+RECALL_DEADLINE = float(os.environ.get("VERA_RECALL_DEADLINE", 10.0))
+
+_recall_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="recall")
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+def _timed(name, fn, *args, **kwargs):
+    with metrics.timer(name):
+        return fn(*args, **kwargs)
+
+
+def _collect(future, source):
+    """Result of a recall source, or None if it missed the deadline or failed; both are counted."""
+    if not future.done():
+        metrics.incr(f"recall.deadline_missed.{source}")
+        return None
+    error = future.exception()
+    if error is not None:
+        metrics.incr(f"recall.{source}_failed")
+        print(f"⚠️ Recall source {source} failed: {error!r}")
+        return None
+    return future.result()
+
 
 class VeraEngine:
-    def __init__(self):
-        self.temp_context = []
+    def __init__(self, rerank_mode=DEFAULT_RERANK_MODE, recall_deadline=RECALL_DEADLINE,
+                 context_budget=CONTEXT_TOKEN_BUDGET, history_budget=HISTORY_TOKEN_BUDGET,
+                 retrieval_mode=DEFAULT_RETRIEVAL_MODE):
+        if rerank_mode not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode '{rerank_mode}', expected one of {RERANK_MODES}")
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{retrieval_mode}', expected one of {RETRIEVAL_MODES}")
+        self.rerank_mode = rerank_mode
+        self.retrieval_mode = retrieval_mode
+        self.recall_deadline = recall_deadline
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        # [system prompt, optional running summary, recent user/assistant turns...]
         self.convo = [{"role": "system", "content": system_prompt}]
+        self._convo_lock = threading.Lock()
+        self._summarizing = False
         self._init_memory()
 
     def _init_memory(self):
-        conversations = fetch_conversations()
+        # Incremental: only conversations newer than the index high-water mark are embedded
         try:
-            create_vector_store(conversations=conversations)
+            sync_vector_store()
         except Exception:
             pass
 
 
     def recall(self, prompt: str):
-        queries = create_queries(prompt=prompt)
+        """
+        Gather memory and Twitch context concurrently within recall_deadline.
+
+        The Twitch lookup and a raw-prompt memory search start immediately,
+        overlapping with LLM query expansion; the expanded queries are then
+        searched together in one batched query. In "lexical_first" mode the
+        raw-prompt search runs first and expansion is skipped when full-text
+        search already found the prompt's terms. Sources that miss the
+        deadline or fail are skipped and counted in /metrics.
+        Returns the recall context messages for this turn; nothing is kept on
+        the engine, so a recall that outlives a cancelled request can't leak
+        into the next prompt.
+        """
+        start = time.monotonic()
+        deadline = start + self.recall_deadline
+
+        def remaining():
+            return max(0.0, deadline - time.monotonic())
+
+        context = []
+        lexical = self.retrieval_mode != "dense"
+        twitch_future = _recall_executor.submit(_timed, "recall.twitch", retrieve_twitch, prompt)
+        search_futures = [_recall_executor.submit(search_memory, [prompt], lexical=lexical)]
+
+        expand = True
+        if self.retrieval_mode == "lexical_first":
+            # Exact names and facts found by full-text search make expansion unnecessary
+            wait(search_futures, timeout=remaining())
+            raw_search = search_futures[0]
+            expand = not (raw_search.done() and not raw_search.exception()
+                          and strong_lexical_match(raw_search.result()))
+
+        if expand:
+            expansion_future = _recall_executor.submit(_timed, "recall.query_expansion", create_queries, prompt=prompt)
+
+            # Fan out the expanded queries as soon as expansion returns
+            wait([expansion_future], timeout=remaining())
+            expanded = _collect(expansion_future, "query_expansion")
+            if expanded:
+                queries = [q for q in expanded if isinstance(q, str) and q != prompt]
+                if queries:
+                    # One batched embed + vector query for every expanded query
+                    search_futures.append(_recall_executor.submit(search_memory, queries, lexical=lexical))
+        else:
+            metrics.incr("recall.expansion_skipped")
+
+        wait(search_futures, timeout=remaining())
+        results = [_collect(f, "memory_search") for f in search_futures]
+        candidates = merge_candidates(*(r for r in results if r is not None))
 
         # Memory RAG
-        embeddings = retrieve_embedding(queries=queries)
+        rerank_future = _recall_executor.submit(rerank, candidates, mode=self.rerank_mode)
+        wait([rerank_future], timeout=remaining())
+        embeddings = _collect(rerank_future, "rerank")
+        if embeddings is None:
+            # Out of time (or the LLM judge failed): fall back to the vector-similarity filter
+            embeddings = rerank(candidates, mode="similarity")
+
         if embeddings:
-            self.temp_context.append({
+            context.append({
                 "role": "system",
                 "content": f"Use the following relevant memories to respond intelligently, but do not repeat verbatim:\n{embeddings}"
             })
 
         # Twitch Chat RAG
-        twitch_context = twitch_rag.retrieve(prompt)
+        wait([twitch_future], timeout=remaining())
+        twitch_context = _collect(twitch_future, "twitch")
         if twitch_context:
-            self.temp_context.append({
+            context.append({
                 "role": "system",
                 "content": "Use these Twitch chat examples as reference for style and context, but do not repeat verbatim:\n" + "\n".join(twitch_context)
             })
 
+        metrics.observe("recall.total", time.monotonic() - start)
+        return context
 
-    def generate_response(self, prompt: str):
-        if prompt.lower().startswith("/forget"):
-            remove_last_conversation()
-            if len(self.convo) >= 2:
+
+    def _split_convo(self):
+        """Split convo into its system head (prompt + running summary) and the turns after it."""
+        head = self.convo[:2] if len(self.convo) > 1 and is_summary(self.convo[1]) else self.convo[:1]
+        return head, self.convo[len(head):]
+
+    def _build_context(self, prompt, recall_context):
+        """
+        Assemble the prompt within context_budget: system prompt, running
+        summary, as many recent turns as fit, recall context, user prompt.
+        """
+        with self._convo_lock:
+            head, turns = self._split_convo()
+
+        user_message = {"role": "user", "content": prompt}
+        budget = self.context_budget - count_message_tokens(head + recall_context + [user_message])
+        recent = fit_recent_turns(turns, max(0, budget))
+        full_context = head + recent + recall_context + [user_message]
+
+        metrics.observe("chat.prompt_tokens", count_message_tokens(full_context))
+        if len(recent) < len(turns):
+            metrics.incr("chat.turns_truncated", len(turns) - len(recent))
+        return full_context
+
+    def _schedule_summary(self):
+        """Fold turns beyond history_budget into the running summary, off the request path."""
+        with self._convo_lock:
+            if self._summarizing:
+                return
+            _, turns = self._split_convo()
+            if len(fit_recent_turns(turns, self.history_budget)) == len(turns):
+                return
+            self._summarizing = True
+        _summary_executor.submit(self._fold_into_summary)
+
+    def _fold_into_summary(self):
+        try:
+            with self._convo_lock:
+                head, turns = self._split_convo()
+                old_turns = turns[:len(turns) - len(fit_recent_turns(turns, self.history_budget))]
+                summary = head[1]["content"][len(SUMMARY_PREFIX):] if len(head) > 1 else ""
+
+            with metrics.timer("context.summarize"):
+                summary = summarize_turns(summary, old_turns)
+
+            with self._convo_lock:
+                head, turns = self._split_convo()
+                if turns[:len(old_turns)] != old_turns:
+                    return  # /forget changed the history meanwhile, try again next turn
+                self.convo = head[:1] + [{"role": "system", "content": SUMMARY_PREFIX + summary}] + turns[len(old_turns):]
+            metrics.incr("context.turns_summarized", len(old_turns))
+        except Exception:
+            metrics.incr("context.summarize_failed")
+        finally:
+            self._summarizing = False
+
+    def _forget_last_turn(self, conversation_id):
+        unindex_conversation(conversation_id)
+        with self._convo_lock:
+            _, turns = self._split_convo()
+            if len(turns) >= 2:
                 self.convo.pop()
                 self.convo.pop()
-            return ""
 
-        self.recall(prompt)
+    def _observe_chunk(self, chunk, start, first_token_at):
+        """Record time-to-first-token and tokens/sec; returns the first-token timestamp."""
+        if chunk["message"]["content"] and first_token_at is None:
+            first_token_at = time.perf_counter()
+            metrics.observe("chat.time_to_first_token", first_token_at - start)
+        if chunk.get("done") and chunk.get("eval_duration"):
+            metrics.observe("chat.tokens_per_sec", chunk["eval_count"] / (chunk["eval_duration"] / 1e9))
+        if chunk.get("done") and "prompt_eval_count" in chunk:
+            metrics.observe("chat.prompt_eval_count", chunk["prompt_eval_count"])
+        return first_token_at
+
+    def _remember_turn(self, conversation_id, prompt, response):
+        index_conversation(conversation_id, prompt=prompt, response=response)
+        with self._convo_lock:
+            self.convo.append({"role": "user", "content": prompt})
+            self.convo.append({"role": "assistant", "content": response})
+        self._schedule_summary()
+
+
+    def stream_response(self, prompt: str):
+        """
+        Yield response tokens as they arrive from the LLM.
+        The turn is stored and indexed once the stream has finished, or with the
+        partial response if the stream is closed early (e.g. client disconnect).
+        """
+        if prompt.lower().startswith("/forget"):
+            self._forget_last_turn(remove_last_conversation())
+            return
+
+        start = time.perf_counter()
+        response = ''
+        try:
+            recall_context = self.recall(prompt)
+
+            first_token_at = None
+            full_context = self._build_context(prompt, recall_context)
+            for chunk in llm.stream_chat("answer", full_context):
+                first_token_at = self._observe_chunk(chunk, start, first_token_at)
+                response += chunk["message"]["content"]
+                yield chunk["message"]["content"]
+        finally:
+            # Store conversation
+            if response.strip():
+                conversation_id = store_conversation(prompt=prompt, response=response)
+                self._remember_turn(conversation_id, prompt, response)
+
 
+    def generate_response(self, prompt: str):
+        return "".join(self.stream_response(prompt))
+
+
+    async def astream_response(self, prompt: str):
+        """
+        Async counterpart of stream_response for the API, with the same
+        store-on-close behaviour.
+        Generation uses the async Ollama client and persistence uses async
+        psycopg; thread-bound work (recall, Chroma) runs off the event loop.
+        """
+        if prompt.lower().startswith("/forget"):
+            conversation_id = await aremove_last_conversation()
+            await asyncio.to_thread(self._forget_last_turn, conversation_id)
+            return
+
+        start = time.perf_counter()
         response = ''
-        full_context = self.convo + self.temp_context + [{"role": "user", "content": prompt}]
-        stream = ollama.chat("llama3", messages=full_context, stream=True)
+        try:
+            recall_context = await asyncio.to_thread(self.recall, prompt)
 
-        for chunk in stream:
-            response += chunk["message"]["content"]
+            first_token_at = None
+            full_context = self._build_context(prompt, recall_context)
+            async for chunk in llm.astream_chat("answer", full_context):
+                first_token_at = self._observe_chunk(chunk, start, first_token_at)
+                response += chunk["message"]["content"]
+                yield chunk["message"]["content"]
+        finally:
+            # Store conversation; shielded so a cancelled request (client disconnect) still saves its turn
+            if response.strip():
+                await asyncio.shield(self._astore_turn(prompt, response))
 
-        # Reset temp_context
-        self.temp_context.clear()
+    async def _astore_turn(self, prompt, response):
+        conversation_id = await astore_conversation(prompt=prompt, response=response)
+        await asyncio.to_thread(self._remember_turn, conversation_id, prompt, response)
 
-        # Store conversation 
-        store_conversation(prompt=prompt, response=response)
-        self.convo.append({"role": "user", "content": prompt})
-        self.convo.append({"role": "assistant", "content": response})
 
-        return response
\ No newline at end of file
+    async def agenerate_response(self, prompt: str):
+        return "".join([token async for token in self.astream_response(prompt)])